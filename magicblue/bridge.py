@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : bridge.py
+# description     : Drive Magic Blue bulbs from a sound or data feed
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# usage           : arecord -f S16_LE -r 44100 | python -m magicblue.bridge
+#                   -m C7:17:1D:43:39:03
+# python_version  : 3.4
+# =============================================================================
+"""
+Turn a stream of samples into colors and push them to bulbs::
+
+    source = stdin_source(block_size=1024)
+    bridge = Bridge(source, SpectrumMapper(44100), bulbs)
+    bridge.run()
+    print(bridge.stats())
+
+A source yields (timestamp, samples) blocks. A mapper turns a block into
+one color per bulb. A :class:`LatestSender` writes the colors from its own
+thread. It paces the writes at max_fps, keeps only the most recent frame
+when the bulbs are slower than the source, and drops frames older than
+max_lag. The lag from capture to the end of the write is measured for each
+sent frame.
+
+Needs numpy (pip install numpy).
+"""
+import argparse
+import logging
+import socket
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from magicblue.transition import _hsv_to_rgb
+except ImportError:
+    from transition import _hsv_to_rgb
+
+
+__all__ = ['Bridge', 'LatestSender', 'SpectrumMapper', 'LevelMapper',
+           'iterable_source', 'stdin_source', 'udp_source', 'sine_source']
+
+
+logger = logging.getLogger(__name__)
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('numpy is required for the bridge, '
+                          'install it with "pip install numpy"')
+
+
+def _decode(data, fmt):
+    if fmt == 's16':
+        return np.frombuffer(data, dtype='<i2').astype(np.float64) / 32768
+    if fmt == 'f32':
+        return np.frombuffer(data, dtype='<f4').astype(np.float64)
+    if fmt == 'text':
+        return np.array([float(v) for v in data.split()])
+    raise ValueError('Unknown sample format: {}'.format(fmt))
+
+
+def iterable_source(values, block_size=1024, clock=time.monotonic):
+    """
+    Blocks of samples from a Python iterable
+
+    :param values: iterable of numbers
+    :return: generator of (timestamp, numpy array)
+    """
+    _require_numpy()
+    block = []
+    for value in values:
+        block.append(value)
+        if len(block) == block_size:
+            yield clock(), np.array(block, dtype=np.float64)
+            block = []
+    if block:
+        yield clock(), np.array(block, dtype=np.float64)
+
+
+def stdin_source(block_size=1024, fmt='s16', stream=None,
+                 clock=time.monotonic):
+    """
+    Blocks of samples read from stdin
+
+    :param fmt: 's16' (signed 16 bits little endian PCM, as given by
+        "arecord -f S16_LE"), 'f32' (32 bits floats) or 'text' (numbers
+        separated by spaces or new lines, one block per line)
+    :param stream: binary stream to read. Default: stdin
+    """
+    _require_numpy()
+    stream = stream or sys.stdin.buffer
+    if fmt == 'text':
+        for line in stream:
+            if line.strip():
+                yield clock(), _decode(line, fmt)
+        return
+    size = block_size * (2 if fmt == 's16' else 4)
+    while True:
+        data = stream.read(size)
+        if len(data) < size:
+            break
+        yield clock(), _decode(data, fmt)
+
+
+def udp_source(port, host='127.0.0.1', fmt='s16', clock=time.monotonic,
+               sock=None):
+    """
+    Blocks of samples received on a local UDP socket, one block per
+    datagram. See :func:`stdin_source` for fmt.
+    """
+    _require_numpy()
+    if sock is None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+    try:
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            yield clock(), _decode(data, fmt)
+    finally:
+        sock.close()
+
+
+def sine_source(frequencies, sample_rate=44100, block_size=1024,
+                nb_blocks=100, clock=time.monotonic, realtime=False):
+    """
+    Synthetic input: a sum of sines, each frequency being a list of
+    (frequency, amplitude) or a frequency
+
+    :param realtime: wait between blocks as a sound card would
+    """
+    _require_numpy()
+    frequencies = [f if isinstance(f, tuple) else (f, 1.0)
+                   for f in frequencies]
+    t = np.arange(block_size) / sample_rate
+    for i in range(nb_blocks):
+        offset = i * block_size / sample_rate
+        block = sum(amplitude * np.sin(2 * np.pi * f * (t + offset))
+                    for f, amplitude in frequencies)
+        if realtime:
+            time.sleep(block_size / sample_rate)
+        yield clock(), block
+
+
+class SpectrumMapper:
+    """
+    FFT of each block, split in log-spaced frequency bands. Bulb i shows
+    band i % nb_bands: the hue is the position of the band in the
+    spectrum, the brightness its energy relative to the recent peak.
+    """
+
+    def __init__(self, sample_rate=44100, nb_bands=None, fmin=40.0,
+                 fmax=8000.0, decay=0.995, floor=0.05):
+        """
+        :param sample_rate: samples per second of the source
+        :param nb_bands: number of bands. Default: one per bulb
+        :param fmin: lowest frequency, in Hz
+        :param fmax: highest frequency, in Hz
+        :param decay: factor applied to the peak energy at each block. The
+            peak is full brightness
+        :param floor: brightness under which a bulb goes black
+        """
+        _require_numpy()
+        self.sample_rate = sample_rate
+        self.nb_bands = nb_bands
+        self.fmin = fmin
+        self.fmax = fmax
+        self.decay = decay
+        self.floor = floor
+        self._peak = None
+        self._edges = {}
+
+    def _band_edges(self, nb_samples, nb_bands):
+        key = (nb_samples, nb_bands)
+        if key not in self._edges:
+            freqs = np.fft.rfftfreq(nb_samples, 1.0 / self.sample_rate)
+            limits = np.geomspace(self.fmin, self.fmax, nb_bands + 1)
+            self._edges[key] = np.searchsorted(freqs, limits)
+        return self._edges[key]
+
+    def bands(self, samples, nb_bands):
+        """
+        :return: energy of each band of samples
+        """
+        window = np.hanning(len(samples))
+        spectrum = np.abs(np.fft.rfft(samples * window)) ** 2
+        edges = self._band_edges(len(samples), nb_bands)
+        # Frequencies above fmax are left out of the last band
+        spectrum = spectrum[:max(edges[-1], 1)]
+        starts = np.minimum(edges[:-1], len(spectrum) - 1)
+        sums = np.add.reduceat(spectrum, starts)
+        sums[edges[1:] <= edges[:-1]] = 0.0  # empty bands
+        return sums
+
+    def __call__(self, samples, nb_bulbs):
+        """
+        :return: uint8 array of shape (nb_bulbs, 3)
+        """
+        nb_bands = self.nb_bands or nb_bulbs
+        energy = np.log1p(self.bands(samples, nb_bands))
+        # Automatic gain: the loudest band of the recent blocks is full
+        # brightness
+        self._peak = max((self._peak or 0.0) * self.decay, energy.max(),
+                         1e-9)
+        level = energy / self._peak
+        level[level < self.floor] = 0.0
+
+        hsv = np.empty((nb_bands, 3))
+        hsv[:, 0] = np.arange(nb_bands) / nb_bands * 0.8  # red to purple
+        hsv[:, 1] = 1.0
+        hsv[:, 2] = level
+        colors = np.round(_hsv_to_rgb(hsv) * 255).astype(np.uint8)
+        return colors[np.arange(nb_bulbs) % nb_bands]
+
+
+class LevelMapper:
+    """
+    For data feeds: the mean of a block, scaled between low and high, picks
+    a hue from blue (low) to red (high), the same for all bulbs
+    """
+
+    def __init__(self, low=0.0, high=1.0):
+        _require_numpy()
+        self.low = low
+        self.high = high
+
+    def __call__(self, samples, nb_bulbs):
+        level = (float(np.mean(samples)) - self.low) / (self.high - self.low)
+        level = min(max(level, 0.0), 1.0)
+        rgb = _hsv_to_rgb(np.array([(1.0 - level) * 2.0 / 3.0, 1.0, 1.0]))
+        color = np.round(rgb * 255).astype(np.uint8)
+        return np.tile(color, (nb_bulbs, 1))
+
+
+class LatestSender:
+    """
+    Writes the most recent frame of colors from its own thread, at most
+    max_fps times per second. Frames replaced before being sent are
+    coalesced, frames older than max_lag are dropped, and a bulb is only
+    written when its color changed.
+    """
+
+    def __init__(self, bulbs, write=None, max_fps=20.0, max_lag=0.25,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        :param bulbs: list of :class:`.MagicBlue`
+        :param write: function(bulb, rgb) doing the actual write. Defaults to
+            bulb.set_color. Pass a fake to test without bulbs
+        :param max_fps: maximum frames written per second
+        :param max_lag: frames captured longer ago than this many seconds
+            are not sent
+        :param clock: monotonic clock returning seconds, shared with the
+            source
+        :param sleep: function used to wait until the next frame
+        """
+        _require_numpy()
+        self.bulbs = list(bulbs)
+        self._write = write or (lambda bulb, rgb: bulb.set_color(rgb))
+        self.max_fps = max_fps
+        self.max_lag = max_lag
+        self._clock = clock
+        self._sleep = sleep
+        self._frame = None
+        self._sent = None
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self.nb_frames = 0
+        self.nb_sent = 0
+        self.nb_coalesced = 0
+        self.nb_dropped = 0
+        self.lags = []
+
+    def push(self, timestamp, colors):
+        """
+        Offer a frame: colors is an array of shape (nb_bulbs, 3), timestamp
+        the clock time its samples were captured
+        """
+        with self._cond:
+            if self._frame is not None:
+                self.nb_coalesced += 1
+            self._frame = (timestamp, colors)
+            self.nb_frames += 1
+            self._cond.notify()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='bridge-sender')
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Send the pending frame, then stop the thread
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        interval = 1.0 / self.max_fps
+        next_send = self._clock()
+        while True:
+            with self._cond:
+                while self._frame is None and not self._stopped:
+                    self._cond.wait()
+                if self._frame is None:
+                    return
+            wait = next_send - self._clock()
+            if wait > 0:
+                self._sleep(wait)
+            with self._cond:
+                timestamp, colors = self._frame
+                self._frame = None
+
+            now = self._clock()
+            if now - timestamp > self.max_lag:
+                self.nb_dropped += 1
+                continue
+            next_send = now + interval
+            self._send(colors)
+            self.lags.append(self._clock() - timestamp)
+            self.nb_sent += 1
+
+    def _send(self, colors):
+        if self._sent is None:
+            self._sent = [None] * len(self.bulbs)
+        for i, bulb in enumerate(self.bulbs):
+            rgb = tuple(int(c) for c in colors[i])
+            if self._sent[i] == rgb:
+                continue
+            try:
+                self._write(bulb, rgb)
+            except Exception as e:
+                # Not recorded as sent, so it's retried with the next frame
+                logger.warning('Write to {} failed: {}'.format(bulb, e))
+            else:
+                self._sent[i] = rgb
+
+    def stats(self):
+        """
+        :return: dict with the frame counters and the lag percentiles, in
+            seconds
+        """
+        lags = np.array(self.lags) if self.lags else np.array([np.nan])
+        return {
+            'frames': self.nb_frames,
+            'sent': self.nb_sent,
+            'coalesced': self.nb_coalesced,
+            'dropped': self.nb_dropped,
+            'lag_p50': float(np.percentile(lags, 50)),
+            'lag_p95': float(np.percentile(lags, 95)),
+            'lag_max': float(np.max(lags)),
+        }
+
+
+class Bridge:
+    """
+    Source -> mapper -> :class:`LatestSender` pipeline
+    """
+
+    def __init__(self, source, mapper, bulbs, sender=None):
+        """
+        :param source: iterable of (timestamp, samples), see the *_source
+            functions
+        :param mapper: function(samples, nb_bulbs) returning an array of
+            colors of shape (nb_bulbs, 3), as :class:`SpectrumMapper`
+        :param bulbs: list of :class:`.MagicBlue`
+        :param sender: a :class:`LatestSender`. Default: one writing with
+            set_color
+        """
+        self.source = source
+        self.mapper = mapper
+        self.bulbs = list(bulbs)
+        self.sender = sender or LatestSender(self.bulbs)
+
+    def run(self):
+        """
+        Consume the source until it ends or KeyboardInterrupt
+        """
+        self.sender.start()
+        try:
+            for timestamp, samples in self.source:
+                self.sender.push(timestamp,
+                                 self.mapper(samples, len(self.bulbs)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.sender.stop()
+
+    def stats(self):
+        return self.sender.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Drive Magic Blue bulbs from audio or data on stdin or '
+                    'UDP')
+    parser.add_argument('-m', '--mac_address', nargs='+', required=True,
+                        help='Bulbs to drive')
+    parser.add_argument('-b', '--bulb-version', type=int, default=7)
+    parser.add_argument('-u', '--udp-port', type=int,
+                        help='Read datagrams on this local port instead of '
+                             'stdin')
+    parser.add_argument('-f', '--format', default='s16',
+                        choices=['s16', 'f32', 'text'])
+    parser.add_argument('-r', '--sample-rate', type=int, default=44100)
+    parser.add_argument('--block-size', type=int, default=1024)
+    parser.add_argument('--level', nargs=2, type=float, metavar=('LOW',
+                                                                 'HIGH'),
+                        help='Map the level of data between LOW and HIGH '
+                             'instead of an audio spectrum')
+    parser.add_argument('--fps', type=float, default=20.0)
+    params = parser.parse_args()
+
+    try:
+        from magicblue.magicbluelib import MagicBlue
+    except ImportError:
+        from magicbluelib import MagicBlue
+
+    logging.basicConfig(level=logging.INFO)
+    bulbs = []
+    for mac in params.mac_address:
+        bulb = MagicBlue(mac, params.bulb_version)
+        if bulb.connect(timeout=10.0, retries=1):
+            bulbs.append(bulb)
+    if not bulbs:
+        return 1
+
+    if params.udp_port:
+        source = udp_source(params.udp_port, fmt=params.format)
+    else:
+        source = stdin_source(params.block_size, params.format)
+    mapper = LevelMapper(*params.level) if params.level \
+        else SpectrumMapper(params.sample_rate)
+    bridge = Bridge(source, mapper, bulbs,
+                    LatestSender(bulbs, max_fps=params.fps))
+    bridge.run()
+    logger.info('Bridge stats: {}'.format(bridge.stats()))
+    for bulb in bulbs:
+        bulb.disconnect()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : clock.py
+# description     : Measure and synchronize the clock of Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime
+
+try:
+    from magicblue.fleet import fan_out
+except ImportError:
+    from fleet import fan_out
+
+
+__all__ = ['ClockReport', 'measure_offset', 'sync_clocks']
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Clock state of a bulb. offset is bulb time minus local time in seconds
+#: (None if it couldn't be measured), rtt the round-trip time of the
+#: measurement, synced tells if the clock has been set
+ClockReport = namedtuple('ClockReport', ['bulb', 'offset', 'rtt', 'synced',
+                                         'error'])
+
+
+def measure_offset(bulb, timeout=2.0, samples=3):
+    """
+    Measure how far the bulb's clock is from the local clock, using
+    get_date_time round-trips. The sample with the shortest round-trip is
+    kept, and local time is taken halfway through it.
+
+    :param bulb: a connected :class:`.MagicBlue`
+    :param timeout: how long to wait for each answer, in seconds
+    :param samples: number of round-trips
+    :return: (offset, rtt) in seconds
+    """
+    if samples < 1:
+        raise ValueError('At least one sample is needed')
+    best = None
+    for _ in range(samples):
+        sent_at = time.time()
+        start = time.monotonic()
+        bulb_time = bulb.get_date_time(timeout)
+        rtt = time.monotonic() - start
+        if best is not None and rtt >= best[1]:
+            continue
+        local_time = datetime.fromtimestamp(sent_at + rtt / 2)
+        # Bulb only reports whole seconds: on average it's half a second
+        # ahead of what it says
+        offset = (bulb_time - local_time).total_seconds() + 0.5
+        best = (offset, rtt)
+    return best
+
+
+def sync_clocks(bulbs, threshold=2.0, force=False, timeout=2.0, samples=3,
+                max_parallel=None):
+    """
+    Measure the clock drift of bulbs in parallel, and set the time of those
+    drifting more than threshold. Time is taken right before each write and
+    corrected by half the measured round-trip.
+
+    :param bulbs: list of connected :class:`.MagicBlue`
+    :param threshold: maximum drift accepted, in seconds
+    :param force: set the time of all bulbs, whatever their drift
+    :param timeout: how long to wait for each answer, in seconds
+    :param samples: number of round-trips per measurement
+    :param max_parallel: maximum number of bulbs handled at the same time
+    :return: list of :class:`ClockReport`, in the same order as bulbs
+    """
+    if samples < 1:
+        raise ValueError('At least one sample is needed')
+
+    def sync(bulb):
+        offset, rtt = measure_offset(bulb, timeout, samples)
+        synced = force or abs(offset) > threshold
+        if synced:
+            logger.debug('Clock of {} is off by {:.2f}s, setting it'.format(
+                bulb, offset))
+            # Time is taken once the bulb is locked, so waiting for other
+            # commands doesn't make it stale
+            bulb.set_date_time(offset=rtt / 2)
+        return offset, rtt, synced
+
+    reports = []
+    for result in fan_out(bulbs, sync, max_parallel):
+        if result.error is not None:
+            reports.append(ClockReport(result.bulb, None, None, False,
+                                       result.error))
+        else:
+            reports.append(ClockReport(result.bulb, *result.value,
+                                       error=None))
+    return reports
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : colors.py
+# description     : Color lookup table and parsing for Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+import colorsys
+import functools
+import math
+import re
+
+
+__all__ = ['NAMED_COLORS', 'parse_color', 'parse_light', 'kelvin_to_rgb']
+
+
+#: CSS3 color names mapped to their RGB value
+NAMED_COLORS = {
+    'aliceblue': (240, 248, 255),
+    'antiquewhite': (250, 235, 215),
+    'aqua': (0, 255, 255),
+    'aquamarine': (127, 255, 212),
+    'azure': (240, 255, 255),
+    'beige': (245, 245, 220),
+    'bisque': (255, 228, 196),
+    'black': (0, 0, 0),
+    'blanchedalmond': (255, 235, 205),
+    'blue': (0, 0, 255),
+    'blueviolet': (138, 43, 226),
+    'brown': (165, 42, 42),
+    'burlywood': (222, 184, 135),
+    'cadetblue': (95, 158, 160),
+    'chartreuse': (127, 255, 0),
+    'chocolate': (210, 105, 30),
+    'coral': (255, 127, 80),
+    'cornflowerblue': (100, 149, 237),
+    'cornsilk': (255, 248, 220),
+    'crimson': (220, 20, 60),
+    'cyan': (0, 255, 255),
+    'darkblue': (0, 0, 139),
+    'darkcyan': (0, 139, 139),
+    'darkgoldenrod': (184, 134, 11),
+    'darkgray': (169, 169, 169),
+    'darkgreen': (0, 100, 0),
+    'darkgrey': (169, 169, 169),
+    'darkkhaki': (189, 183, 107),
+    'darkmagenta': (139, 0, 139),
+    'darkolivegreen': (85, 107, 47),
+    'darkorange': (255, 140, 0),
+    'darkorchid': (153, 50, 204),
+    'darkred': (139, 0, 0),
+    'darksalmon': (233, 150, 122),
+    'darkseagreen': (143, 188, 143),
+    'darkslateblue': (72, 61, 139),
+    'darkslategray': (47, 79, 79),
+    'darkslategrey': (47, 79, 79),
+    'darkturquoise': (0, 206, 209),
+    'darkviolet': (148, 0, 211),
+    'deeppink': (255, 20, 147),
+    'deepskyblue': (0, 191, 255),
+    'dimgray': (105, 105, 105),
+    'dimgrey': (105, 105, 105),
+    'dodgerblue': (30, 144, 255),
+    'firebrick': (178, 34, 34),
+    'floralwhite': (255, 250, 240),
+    'forestgreen': (34, 139, 34),
+    'fuchsia': (255, 0, 255),
+    'gainsboro': (220, 220, 220),
+    'ghostwhite': (248, 248, 255),
+    'gold': (255, 215, 0),
+    'goldenrod': (218, 165, 32),
+    'gray': (128, 128, 128),
+    'green': (0, 128, 0),
+    'greenyellow': (173, 255, 47),
+    'grey': (128, 128, 128),
+    'honeydew': (240, 255, 240),
+    'hotpink': (255, 105, 180),
+    'indianred': (205, 92, 92),
+    'indigo': (75, 0, 130),
+    'ivory': (255, 255, 240),
+    'khaki': (240, 230, 140),
+    'lavender': (230, 230, 250),
+    'lavenderblush': (255, 240, 245),
+    'lawngreen': (124, 252, 0),
+    'lemonchiffon': (255, 250, 205),
+    'lightblue': (173, 216, 230),
+    'lightcoral': (240, 128, 128),
+    'lightcyan': (224, 255, 255),
+    'lightgoldenrodyellow': (250, 250, 210),
+    'lightgray': (211, 211, 211),
+    'lightgreen': (144, 238, 144),
+    'lightgrey': (211, 211, 211),
+    'lightpink': (255, 182, 193),
+    'lightsalmon': (255, 160, 122),
+    'lightseagreen': (32, 178, 170),
+    'lightskyblue': (135, 206, 250),
+    'lightslategray': (119, 136, 153),
+    'lightslategrey': (119, 136, 153),
+    'lightsteelblue': (176, 196, 222),
+    'lightyellow': (255, 255, 224),
+    'lime': (0, 255, 0),
+    'limegreen': (50, 205, 50),
+    'linen': (250, 240, 230),
+    'magenta': (255, 0, 255),
+    'maroon': (128, 0, 0),
+    'mediumaquamarine': (102, 205, 170),
+    'mediumblue': (0, 0, 205),
+    'mediumorchid': (186, 85, 211),
+    'mediumpurple': (147, 112, 219),
+    'mediumseagreen': (60, 179, 113),
+    'mediumslateblue': (123, 104, 238),
+    'mediumspringgreen': (0, 250, 154),
+    'mediumturquoise': (72, 209, 204),
+    'mediumvioletred': (199, 21, 133),
+    'midnightblue': (25, 25, 112),
+    'mintcream': (245, 255, 250),
+    'mistyrose': (255, 228, 225),
+    'moccasin': (255, 228, 181),
+    'navajowhite': (255, 222, 173),
+    'navy': (0, 0, 128),
+    'oldlace': (253, 245, 230),
+    'olive': (128, 128, 0),
+    'olivedrab': (107, 142, 35),
+    'orange': (255, 165, 0),
+    'orangered': (255, 69, 0),
+    'orchid': (218, 112, 214),
+    'palegoldenrod': (238, 232, 170),
+    'palegreen': (152, 251, 152),
+    'paleturquoise': (175, 238, 238),
+    'palevioletred': (219, 112, 147),
+    'papayawhip': (255, 239, 213),
+    'peachpuff': (255, 218, 185),
+    'peru': (205, 133, 63),
+    'pink': (255, 192, 203),
+    'plum': (221, 160, 221),
+    'powderblue': (176, 224, 230),
+    'purple': (128, 0, 128),
+    'red': (255, 0, 0),
+    'rosybrown': (188, 143, 143),
+    'royalblue': (65, 105, 225),
+    'saddlebrown': (139, 69, 19),
+    'salmon': (250, 128, 114),
+    'sandybrown': (244, 164, 96),
+    'seagreen': (46, 139, 87),
+    'seashell': (255, 245, 238),
+    'sienna': (160, 82, 45),
+    'silver': (192, 192, 192),
+    'skyblue': (135, 206, 235),
+    'slateblue': (106, 90, 205),
+    'slategray': (112, 128, 144),
+    'slategrey': (112, 128, 144),
+    'snow': (255, 250, 250),
+    'springgreen': (0, 255, 127),
+    'steelblue': (70, 130, 180),
+    'tan': (210, 180, 140),
+    'teal': (0, 128, 128),
+    'thistle': (216, 191, 216),
+    'tomato': (255, 99, 71),
+    'turquoise': (64, 224, 208),
+    'violet': (238, 130, 238),
+    'wheat': (245, 222, 179),
+    'white': (255, 255, 255),
+    'whitesmoke': (245, 245, 245),
+    'yellow': (255, 255, 0),
+    'yellowgreen': (154, 205, 50),
+}
+
+_HEX_RE = re.compile(r'^#([0-9a-f]{3}|[0-9a-f]{6})$')
+_FUNC_RE = re.compile(r'^(rgb|hsv)\(([^)]*)\)$')
+_KELVIN_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*k$')
+_WARM_RE = re.compile(r'^warm(?:\(\s*([^)]*?)\s*\))?$')
+
+MIN_KELVIN = 1000
+MAX_KELVIN = 40000
+
+
+def parse_color(value):
+    """
+    Convert a color to an RGB tuple. Results for strings are cached so
+    applying the same scene again doesn't parse anything.
+
+    Accepted formats:
+
+    - a list/tuple of 3 values between 0 and 255
+    - a CSS3 color name (eg. ``navy``)
+    - ``#rgb`` or ``#rrggbb``
+    - ``rgb(r, g, b)`` with values between 0 and 255 or percentages
+    - ``hsv(h, s, v)`` with hue in degrees, saturation and value in percents
+    - a color temperature in Kelvin (eg. ``2700K``)
+
+    :param value: the color to parse
+    :return: (r, g, b) tuple
+    :raises ValueError: if the color can't be parsed
+    """
+    if isinstance(value, str):
+        return _parse_color_str(value.strip().lower())
+
+    try:
+        rgb = tuple(int(component) for component in value)
+    except TypeError:
+        raise ValueError('Invalid color: {!r}'.format(value))
+    if len(rgb) != 3 or not all(0 <= c <= 255 for c in rgb):
+        raise ValueError('Invalid color: {!r}'.format(value))
+    return rgb
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_light(value):
+    """
+    Parse a light setting, which is either a color accepted by
+    :func:`parse_color` or the bulb's warm light given as ``warm`` or
+    ``warm(intensity)`` with intensity between 0.0 and 1.0.
+
+    :param value: the light setting as a string
+    :return: ('warm_light', intensity) or ('color', (r, g, b))
+    :raises ValueError: if the value can't be parsed
+    """
+    value = value.strip().lower()
+    match = _WARM_RE.match(value)
+    if match is None:
+        return 'color', _parse_color_str(value)
+
+    intensity = _parse_unit(match.group(1)) if match.group(1) else 1.0
+    return 'warm_light', intensity
+
+
+@functools.lru_cache(maxsize=None)
+def kelvin_to_rgb(kelvin):
+    """
+    Approximate the RGB value of a black body at the given temperature
+
+    :param kelvin: color temperature, between 1000 and 40000
+    :return: (r, g, b) tuple
+    """
+    if not MIN_KELVIN <= kelvin <= MAX_KELVIN:
+        raise ValueError('Color temperature must be between {}K and {}K'
+                         .format(MIN_KELVIN, MAX_KELVIN))
+
+    temp = kelvin / 100
+    if temp <= 66:
+        r = 255
+        g = 99.4708025861 * math.log(temp) - 161.1195681661
+        b = 0 if temp <= 19 else \
+            138.5177312231 * math.log(temp - 10) - 305.0447927307
+    else:
+        r = 329.698727446 * math.pow(temp - 60, -0.1332047592)
+        g = 288.1221695283 * math.pow(temp - 60, -0.0755148492)
+        b = 255
+    return tuple(int(round(min(max(c, 0), 255))) for c in (r, g, b))
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_color_str(value):
+    if value in NAMED_COLORS:
+        return NAMED_COLORS[value]
+
+    match = _HEX_RE.match(value)
+    if match is not None:
+        digits = match.group(1)
+        if len(digits) == 3:
+            digits = ''.join(d * 2 for d in digits)
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+    match = _FUNC_RE.match(value)
+    if match is not None:
+        args = [arg.strip() for arg in match.group(2).split(',')]
+        if len(args) != 3:
+            raise ValueError('Invalid color: {!r}'.format(value))
+        if match.group(1) == 'rgb':
+            return tuple(_parse_component(arg) for arg in args)
+        h = float(args[0]) % 360 / 360
+        s, v = (_parse_percent(arg) for arg in args[1:])
+        return tuple(int(round(c * 255))
+                     for c in colorsys.hsv_to_rgb(h, s, v))
+
+    match = _KELVIN_RE.match(value)
+    if match is not None:
+        return kelvin_to_rgb(int(float(match.group(1))))
+
+    raise ValueError('Invalid color: {!r}'.format(value))
+
+
+def _parse_component(arg):
+    if arg.endswith('%'):
+        component = int(round(_parse_percent(arg) * 255))
+    else:
+        component = int(arg)
+    if not 0 <= component <= 255:
+        raise ValueError('Color component out of range: {}'.format(arg))
+    return component
+
+
+def _parse_percent(arg):
+    percent = float(arg.rstrip('%'))
+    if not 0 <= percent <= 100:
+        raise ValueError('Percentage out of range: {}'.format(arg))
+    return percent / 100
+
+
+def _parse_unit(arg):
+    value = _parse_percent(arg) if arg.endswith('%') else float(arg)
+    if not 0.0 <= value <= 1.0:
+        raise ValueError('Intensity must be between 0.0 and 1.0: {}'
+                         .format(arg))
+    return value
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : config.py
+# description     : Declarative configuration of a fleet of Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+"""
+A fleet is described in a JSON, TOML or YAML file::
+
+    {
+        "adapter": 0,
+        "max_parallel": 4,
+        "retries": 2,
+        "bulbs": [
+            {"mac": "C7:17:1D:43:39:03", "alias": "desk", "version": 9,
+             "room": "office"},
+            {"mac": "C7:17:1D:43:39:04", "alias": "lamp", "version": 7,
+             "addr_type": "random", "room": "office", "adapter": 1}
+        ],
+        "groups": {"evening": ["desk", "lamp"]}
+    }
+
+Only mac is required for a bulb. Each room is also a group. TOML needs
+Python 3.11+ or the toml package, YAML needs PyYAML.
+"""
+import json
+import logging
+import os
+from collections import namedtuple
+
+try:
+    from magicblue.magicbluelib import MagicBlue
+    from magicblue.fleet import Fleet
+except ImportError:
+    from magicbluelib import MagicBlue
+    from fleet import Fleet
+
+
+__all__ = ['BulbConfig', 'FleetConfig']
+
+
+logger = logging.getLogger(__name__)
+
+
+#: A bulb of the fleet. Fields other than mac_address may be None
+BulbConfig = namedtuple('BulbConfig', ['mac_address', 'alias', 'version',
+                                       'addr_type', 'room', 'adapter'])
+
+
+def _load_toml(f):
+    try:
+        import tomllib as toml
+    except ImportError:
+        try:
+            import toml
+        except ImportError:
+            raise ImportError('Reading TOML needs Python 3.11+ or the toml '
+                              'package, install it with "pip install toml"')
+    return toml.loads(f.read())
+
+
+def _load_yaml(f):
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError('Reading YAML needs PyYAML, install it with '
+                          '"pip install pyyaml"')
+    return yaml.safe_load(f)
+
+
+_LOADERS = {
+    '.json': json.load,
+    '.toml': _load_toml,
+    '.yaml': _load_yaml,
+    '.yml': _load_yaml,
+}
+
+
+class FleetConfig:
+    """
+    Bulbs, groups and connection settings of a fleet
+    """
+
+    def __init__(self, bulbs, groups=None, adapter=0, max_parallel=4,
+                 retries=2):
+        """
+        :param bulbs: list of :class:`BulbConfig`
+        :param groups: dict of group name => list of aliases or MAC addresses
+        :param adapter: bluetooth adapter used by bulbs not defining one
+        :param max_parallel: maximum number of simultaneous connections
+        :param retries: connection attempts after the first one failed
+        """
+        self.bulbs = list(bulbs)
+        self.groups = dict(groups or {})
+        self.adapter = adapter
+        self.max_parallel = max_parallel
+        self.retries = retries
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a config from parsed JSON/TOML/YAML data
+        """
+        bulbs = []
+        for entry in data.get('bulbs', []):
+            if 'mac' not in entry:
+                raise ValueError('Bulb without "mac": {}'.format(entry))
+            bulbs.append(BulbConfig(entry['mac'], entry.get('alias'),
+                                    entry.get('version'),
+                                    entry.get('addr_type'),
+                                    entry.get('room'), entry.get('adapter')))
+        return cls(bulbs, data.get('groups'), data.get('adapter', 0),
+                   data.get('max_parallel', 4), data.get('retries', 2))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a config file, its format is given by its extension (.json,
+        .toml, .yaml or .yml)
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in _LOADERS:
+            raise ValueError('Unknown config format: {}'.format(path))
+        with open(path) as f:
+            return cls.from_dict(_LOADERS[extension](f))
+
+    def create_fleet(self):
+        """
+        :return: a :class:`.Fleet` of not yet connected bulbs, with the
+            aliases and groups of the config
+        """
+        fleet = Fleet()
+        for entry in self.bulbs:
+            bulb = MagicBlue(entry.mac_address,
+                             version=entry.version or 7,
+                             addr_type=entry.addr_type)
+            adapter = entry.adapter if entry.adapter is not None \
+                else self.adapter
+            fleet.add(bulb, alias=entry.alias, adapter=adapter)
+            if entry.room:
+                fleet.groups.setdefault(entry.room, []).append(bulb)
+
+        for name, members in self.groups.items():
+            fleet.groups[name] = [bulb for member in members
+                                  for bulb in fleet.select(member)]
+        return fleet
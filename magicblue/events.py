@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : events.py
+# description     : Subscribe to state changes of Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+import logging
+import threading
+from collections import namedtuple
+
+
+__all__ = ['EventBus', 'EventSource', 'StateChange', 'ScheduleChange',
+           'Disconnect', 'STATE_CHANGE', 'SCHEDULE', 'DISCONNECT']
+
+
+logger = logging.getLogger(__name__)
+
+
+STATE_CHANGE = 'state_change'
+SCHEDULE = 'schedule'
+DISCONNECT = 'disconnect'
+
+#: Device info of a bulb changed. previous and current are
+#: :class:`.DeviceInfo` (previous is None the first time), changed is the set
+#: of modified fields
+StateChange = namedtuple('StateChange', ['bulb', 'previous', 'current',
+                                         'changed'])
+
+#: Time schedule of a bulb changed. previous and current are
+#: :class:`.Schedule`, changed is the set of modified slots
+ScheduleChange = namedtuple('ScheduleChange', ['bulb', 'previous', 'current',
+                                               'changed'])
+
+#: Connection to a bulb ended. reason is 'requested' or 'lost'
+Disconnect = namedtuple('Disconnect', ['bulb', 'reason'])
+
+
+def diff_state(previous, current):
+    """
+    :return: set of the fields that differ between two device infos
+    """
+    if previous is None:
+        return set(current._fields)
+    return {field for field, old, new in zip(current._fields, previous,
+                                             current)
+            if old != new}
+
+
+def diff_schedule(previous, current):
+    """
+    :return: set of the indexes of the timer slots that differ
+    """
+    previous = previous or []
+    return {i for i, item in enumerate(current)
+            if i >= len(previous) or previous[i] != item}
+
+
+class EventBus:
+    """
+    Minimal thread-safe publish/subscribe
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, event, callback):
+        """
+        Call callback(payload) each time event is emitted
+
+        :return: a function to call to unsubscribe
+        """
+        with self._lock:
+            self._subscribers.setdefault(event, []).append(callback)
+        return lambda: self.unsubscribe(event, callback)
+
+    def unsubscribe(self, event, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(event, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def emit(self, event, payload):
+        with self._lock:
+            callbacks = list(self._subscribers.get(event, ()))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception('Error in {} subscriber'.format(event))
+
+    def has_subscribers(self, event):
+        return bool(self._subscribers.get(event))
+
+
+class EventSource:
+    """
+    Subscription helpers for objects having an ``events`` :class:`EventBus`.
+    Callbacks run on the thread that received the notification (usually a
+    :class:`.NotificationPump`) and should return quickly.
+    """
+
+    def on_state_change(self, callback):
+        """
+        Call callback with a :class:`StateChange` when the power, color,
+        effect or brightness of a bulb changes
+
+        :return: a function to call to unsubscribe
+        """
+        return self.events.subscribe(STATE_CHANGE, callback)
+
+    def on_schedule(self, callback):
+        """
+        Call callback with a :class:`ScheduleChange` when the time schedule
+        of a bulb is received and differs from the previous one
+
+        :return: a function to call to unsubscribe
+        """
+        return self.events.subscribe(SCHEDULE, callback)
+
+    def on_disconnect(self, callback):
+        """
+        Call callback with a :class:`Disconnect` when a bulb is
+        disconnected
+
+        :return: a function to call to unsubscribe
+        """
+        return self.events.subscribe(DISCONNECT, callback)
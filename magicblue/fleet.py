@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : fleet.py
+# description     : Run operations on many Magic Blue bulbs at once
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+import functools
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from time import monotonic, sleep
+
+try:
+    from magicblue.events import EventBus, EventSource, STATE_CHANGE, \
+        SCHEDULE, DISCONNECT
+    from magicblue.magicbluelib import ConnectFailure, Protocol, \
+        backoff_delay
+    from magicblue.colors import parse_color
+    from magicblue.health import CircuitOpenError
+    from magicblue.scan import scan
+except ImportError:
+    from events import EventBus, EventSource, STATE_CHANGE, SCHEDULE, \
+        DISCONNECT
+    from magicbluelib import ConnectFailure, Protocol, backoff_delay
+    from colors import parse_color
+    from health import CircuitOpenError
+    from scan import scan
+
+
+__all__ = ['BulbResult', 'ConnectReport', 'BroadcastReport', 'Fleet',
+           'fan_out', 'connect_many', 'broadcast']
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Outcome of an operation on a bulb. error is None if it succeeded, latency
+#: is the duration of the operation in seconds
+BulbResult = namedtuple('BulbResult', ['bulb', 'value', 'error', 'latency'])
+
+#: Readiness of a bulb after connecting the fleet. latency is the duration of
+#: the successful attempt (or of the last one), failure the
+#: :class:`.ConnectFailure` of the last attempt and error its exception
+ConnectReport = namedtuple('ConnectReport', ['bulb', 'connected', 'attempts',
+                                             'latency', 'failure', 'error'])
+
+#: Outcome of a broadcast. results are :class:`BulbResult` whose value is the
+#: time the write ended, in seconds since the broadcast started. skew is the
+#: time between the first and the last successful write
+BroadcastReport = namedtuple('BroadcastReport', ['results', 'skew'])
+
+
+def fan_out(bulbs, func, max_parallel=None, on_result=None, timeout=None):
+    """
+    Call func(bulb) for each bulb in parallel. Exceptions are caught and
+    returned in the results, so one failing bulb doesn't stop the others.
+
+    :param bulbs: list of :class:`.MagicBlue`
+    :param func: function taking a bulb as only parameter
+    :param max_parallel: maximum number of bulbs handled at the same time.
+        Default: all of them
+    :param on_result: function called with each :class:`BulbResult` as soon
+        as it's available, from the thread that produced it
+    :param timeout: seconds to wait for all the bulbs. The bulbs still busy
+        get a TimeoutError result, their call keeps running in the
+        background. Default: wait for all of them
+    :return: list of :class:`BulbResult`, in the same order as bulbs
+    """
+    bulbs = list(bulbs)
+    if not bulbs:
+        return []
+
+    pool = ThreadPoolExecutor(max_workers=max_parallel or len(bulbs))
+    try:
+        futures = [pool.submit(_timed_call, func, bulb) for bulb in bulbs]
+        if on_result is not None:
+            for future in futures:
+                future.add_done_callback(
+                    lambda future: on_result(future.result()))
+        wait(futures, timeout)
+        return [future.result() if future.done() else
+                BulbResult(bulb, None, TimeoutError(
+                    'No answer after {}s'.format(timeout)), timeout)
+                for bulb, future in zip(bulbs, futures)]
+    finally:
+        pool.shutdown(wait=timeout is None)
+
+
+def _timed_call(func, bulb):
+    start = monotonic()
+    try:
+        value = func(bulb)
+    except Exception as e:
+        logger.debug('{} failed on {}: {!r}'.format(
+            getattr(func, '__name__', func), bulb, e))
+        return BulbResult(bulb, None, e, monotonic() - start)
+    return BulbResult(bulb, value, None, monotonic() - start)
+
+
+def connect_many(bulbs, max_parallel=4, adapters=0, timeout=10.0, retries=2,
+                 backoff=1.0, max_per_adapter=None):
+    """
+    Connect bulbs in parallel. A bulb waits for its backoff delay without
+    holding a connection slot, so other bulbs can use it meanwhile.
+
+    :param bulbs: list of :class:`.MagicBlue`
+    :param max_parallel: maximum number of connections made at the same time
+    :param adapters: bluetooth adapter number of all the bulbs, or dict of
+        bulb => adapter number
+    :param timeout: seconds to wait for each attempt
+    :param retries: attempts after the first one failed
+    :param backoff: seconds to wait before the first retry, see
+        :func:`.backoff_delay`
+    :param max_per_adapter: maximum number of connections made at the same
+        time on each adapter. Some controllers only accept one at a time.
+        Default: max_parallel
+    :return: list of :class:`ConnectReport`, in the same order as bulbs
+    """
+    bulbs = list(bulbs)
+    if not isinstance(adapters, dict):
+        adapters = dict.fromkeys(bulbs, adapters)
+    slots = {adapter: threading.BoundedSemaphore(
+                 max_per_adapter or max_parallel or len(bulbs))
+             for adapter in set(adapters.values())}
+
+    def connect(bulb):
+        adapter = adapters.get(bulb, 0)
+        for attempt in range(1, retries + 2):
+            if attempt > 1:
+                sleep(backoff_delay(attempt - 1, backoff))
+            with slots[adapter]:
+                start = monotonic()
+                connected = bulb.connect_once(adapter, timeout)
+                latency = monotonic() - start
+            if connected:
+                return ConnectReport(bulb, True, attempt, latency, None, None)
+            logger.debug('Attempt {} to connect {} failed: {}'.format(
+                attempt, bulb, bulb.connect_failure))
+            if bulb.connect_failure is ConnectFailure.invalid_address:
+                break
+        return ConnectReport(bulb, False, attempt, latency,
+                             bulb.connect_failure, bulb.connect_error)
+
+    return [result.value if result.error is None else
+            ConnectReport(result.bulb, False, 0, result.latency,
+                          ConnectFailure.adapter, result.error)
+            for result in fan_out(bulbs, connect, max_parallel)]
+
+
+def broadcast(bulbs, frame, adapters=0):
+    """
+    Write the same frame to many bulbs. The frame is shared by all writes
+    and the bulbs of an adapter are written one after the other in a tight
+    loop, adapters in parallel. Bulbs not connected are reported as failed.
+
+    :param bulbs: list of :class:`.MagicBlue`
+    :param frame: encoded message, see :class:`.Protocol`
+    :param adapters: bluetooth adapter number of all the bulbs, or dict of
+        bulb => adapter number
+    :return: a :class:`BroadcastReport`
+    """
+    bulbs = list(bulbs)
+    frame = bytes(frame)
+    if not isinstance(adapters, dict):
+        adapters = dict.fromkeys(bulbs, adapters)
+    by_adapter = {}
+    for bulb in bulbs:
+        by_adapter.setdefault(adapters.get(bulb, 0), []).append(bulb)
+
+    start = monotonic()
+
+    def write_all(group):
+        results = []
+        for bulb in group:
+            before = monotonic()
+            try:
+                bulb.send_frames([frame])
+            except Exception as e:
+                results.append(BulbResult(bulb, None, e,
+                                          monotonic() - before))
+            else:
+                after = monotonic()
+                results.append(BulbResult(bulb, after - start, None,
+                                          after - before))
+        return results
+
+    # The first adapter is written from this thread, the others from
+    # short-lived threads
+    groups = list(by_adapter.values())
+    done = []
+    threads = [threading.Thread(target=lambda group=group: done.extend(
+                   write_all(group))) for group in groups[1:]]
+    for thread in threads:
+        thread.start()
+    done.extend(write_all(groups[0]) if groups else [])
+    for thread in threads:
+        thread.join()
+
+    by_bulb = {result.bulb: result for result in done}
+    results = [by_bulb[bulb] for bulb in bulbs]
+    ends = [result.value for result in results if result.error is None]
+    skew = max(ends) - min(ends) if ends else 0.0
+    logger.debug('Broadcast to {} bulbs, skew {:.1f}ms'.format(
+        len(ends), skew * 1000))
+    return BroadcastReport(results, skew)
+
+
+class Fleet(EventSource):
+    """
+    A group of bulbs. Events of every bulb are forwarded to the fleet's own
+    subscribers, so a single subscription covers all of them. Bulbs can be
+    given an alias and put in named groups, see :meth:`select`.
+    """
+
+    def __init__(self, bulbs=(), health=None):
+        """
+        :param bulbs: list of :class:`.MagicBlue`
+        :param health: a :class:`.HealthMonitor`. When given, the bulbs it
+            considers unhealthy are skipped by :meth:`fan_out` and
+            :meth:`broadcast`, and get a :class:`.CircuitOpenError` result
+        """
+        self.bulbs = []
+        self.events = EventBus()
+        self.aliases = {}
+        self.groups = {}
+        self.adapters = {}
+        self.health = health
+        self._unsubscribers = {}
+        for bulb in bulbs:
+            self.add(bulb)
+        if health is not None:
+            health.watch(self)
+
+    def add(self, bulb, alias=None, adapter=0):
+        """
+        Add a bulb to the fleet
+
+        :param alias: name to select the bulb with
+        :param adapter: bluetooth adapter number used to connect the bulb
+        """
+        if bulb in self._unsubscribers:
+            return
+        self.bulbs.append(bulb)
+        self.adapters[bulb] = adapter
+        if alias is not None:
+            self.aliases[alias] = bulb
+        self._unsubscribers[bulb] = [
+            bulb.events.subscribe(event, functools.partial(self.events.emit,
+                                                           event))
+            for event in (STATE_CHANGE, SCHEDULE, DISCONNECT)]
+
+    def remove(self, bulb):
+        """
+        Remove a bulb from the fleet
+        """
+        for unsubscribe in self._unsubscribers.pop(bulb, []):
+            unsubscribe()
+        if bulb in self.bulbs:
+            self.bulbs.remove(bulb)
+        self.adapters.pop(bulb, None)
+        for alias in [a for a, b in self.aliases.items() if b is bulb]:
+            del self.aliases[alias]
+        for members in self.groups.values():
+            if bulb in members:
+                members.remove(bulb)
+
+    def select(self, selector):
+        """
+        Find bulbs by alias, group name or MAC address
+
+        :return: list of :class:`.MagicBlue`
+        :raises KeyError: if nothing matches
+        """
+        if selector in self.aliases:
+            return [self.aliases[selector]]
+        if selector in self.groups:
+            return list(self.groups[selector])
+        bulbs = [bulb for bulb in self.bulbs
+                 if bulb.mac_address.lower() == selector.lower()]
+        if not bulbs:
+            raise KeyError(selector)
+        return bulbs
+
+    def connect_all(self, max_parallel=4, retries=2, timeout=10.0,
+                    backoff=1.0, max_per_adapter=None):
+        """
+        Connect all bulbs not connected yet on their adapter, see
+        :func:`connect_many`
+
+        :return: list of :class:`ConnectReport`, in the same order as the
+            bulbs
+        """
+        bulbs = [bulb for bulb in self.bulbs if not bulb.is_connected()]
+        reports = {report.bulb: report for report in connect_many(
+            bulbs, max_parallel, self.adapters, timeout, retries, backoff,
+            max_per_adapter)}
+        if self.health is not None:
+            for report in reports.values():
+                self.health.record_connect(report)
+        return [reports.get(bulb) or
+                ConnectReport(bulb, True, 0, 0.0, None, None)
+                for bulb in self.bulbs]
+
+    def scan_rssi(self, timeout=5.0, adapter=0):
+        """
+        Scan for the bulbs of the fleet and record their signal strength in
+        the health monitor, see :meth:`.HealthMonitor.record_scan`. The scan
+        stops as soon as all the bulbs were seen
+
+        :return: the bulbs whose RSSI was recorded
+        """
+        if self.health is None:
+            raise ValueError('Fleet has no health monitor')
+        devices = scan(timeout, adapter)
+        try:
+            return self.health.record_scan(self.bulbs, devices)
+        finally:
+            devices.close()
+
+    def disconnect_all(self):
+        """
+        Disconnect all bulbs
+        """
+        for bulb in self.bulbs:
+            bulb.disconnect()
+
+    def broadcast(self, frame, bulbs=None):
+        """
+        Write the same frame to the bulbs of the fleet, grouped by adapter,
+        see :func:`broadcast`
+
+        :param bulbs: bulbs to write to. Default: all of them
+        """
+        bulbs = self.bulbs if bulbs is None else bulbs
+        if self.health is None:
+            return broadcast(bulbs, frame, self.adapters)
+        report = broadcast(self.health.available(bulbs), frame,
+                           self.adapters)
+        return report._replace(results=self._guarded(bulbs, report.results))
+
+    def set_color(self, rgb_color, bulbs=None):
+        """
+        Set all bulbs to the same color with a single broadcast frame
+
+        :param rgb_color: anything :func:`.parse_color` accepts
+        :return: a :class:`BroadcastReport`
+        """
+        return self.broadcast(Protocol.encode_set_rgb(*parse_color(rgb_color)),
+                              bulbs)
+
+    def turn_on(self, bulbs=None):
+        """
+        Turn all bulbs on with a single broadcast frame
+        """
+        return self.broadcast(Protocol.encode_turn_on(), bulbs)
+
+    def turn_off(self, bulbs=None):
+        """
+        Turn all bulbs off with a single broadcast frame
+        """
+        return self.broadcast(Protocol.encode_turn_off(), bulbs)
+
+    def fan_out(self, func, max_parallel=None, timeout=None, bulbs=None):
+        """
+        Call func(bulb) for each bulb of the fleet in parallel, see
+        :func:`fan_out`
+
+        :param bulbs: bulbs to call func on. Default: all of them
+        """
+        bulbs = self.bulbs if bulbs is None else bulbs
+        if self.health is None:
+            return fan_out(bulbs, func, max_parallel, timeout=timeout)
+        results = fan_out(self.health.available(bulbs), func, max_parallel,
+                          timeout=timeout)
+        return self._guarded(bulbs, results)
+
+    def _guarded(self, bulbs, results):
+        """Record results in the health monitor, fill in skipped bulbs"""
+        by_bulb = {}
+        for result in results:
+            self.health.record(result)
+            by_bulb[result.bulb] = result
+        return [by_bulb.get(bulb) or BulbResult(
+                    bulb, None, CircuitOpenError('{} is unhealthy'.format(
+                        bulb)), 0.0)
+                for bulb in bulbs]
+
+    def __iter__(self):
+        return iter(self.bulbs)
+
+    def __len__(self):
+        return len(self.bulbs)
+
+    def __contains__(self, bulb):
+        return bulb in self._unsubscribers
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : health.py
+# description     : Health tracking and circuit breaker for Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+"""
+Track how well each bulb answers and stop sending it commands when it
+keeps failing::
+
+    fleet = Fleet(bulbs, health=HealthMonitor())
+
+A bulb whose circuit is open is skipped by the fleet for cooldown seconds,
+then the next command is sent to it as a probe: if it succeeds the bulb is
+back, otherwise the circuit opens again.
+"""
+import logging
+import threading
+from enum import Enum
+from time import monotonic
+
+
+__all__ = ['HealthMonitor', 'BulbHealth', 'BreakerState', 'CircuitOpenError']
+
+
+logger = logging.getLogger(__name__)
+
+
+class BreakerState(Enum):
+    """
+    State of the circuit breaker of a bulb
+    """
+    closed = 'closed'        #: healthy, commands are sent
+    open = 'open'            #: unhealthy, commands are skipped
+    half_open = 'half_open'  #: cooldown over, a probe command is allowed
+
+
+class CircuitOpenError(Exception):
+    """
+    The command was not sent because the bulb is considered unhealthy
+    """
+
+
+class BulbHealth:
+    """
+    Statistics of a bulb. latency and error_rate are exponentially weighted
+    moving averages of the duration (seconds) and failure (0 or 1) of its
+    operations.
+    """
+
+    def __init__(self):
+        self.rssi = None
+        self.latency = None
+        self.error_rate = 0.0
+        self.nb_operations = 0
+        self.consecutive_failures = 0
+        self.connects = 0
+        self.reconnects = 0
+        self.disconnects = 0
+        self.state = BreakerState.closed
+        self.opened_at = None
+        self.probing = False
+
+    def as_dict(self):
+        return {
+            'rssi': self.rssi,
+            'latency': self.latency,
+            'error_rate': self.error_rate,
+            'nb_operations': self.nb_operations,
+            'consecutive_failures': self.consecutive_failures,
+            'reconnects': self.reconnects,
+            'disconnects': self.disconnects,
+            'state': self.state.value,
+        }
+
+
+class HealthMonitor:
+    """
+    Health of many bulbs, with a circuit breaker per bulb. The circuit opens
+    after failure_threshold consecutive failures, or when the error rate or
+    the latency go over their threshold.
+    """
+
+    def __init__(self, failure_threshold=3, error_rate_threshold=0.5,
+                 latency_threshold=None, cooldown=10.0, smoothing=0.2,
+                 clock=monotonic):
+        """
+        :param failure_threshold: consecutive failures opening the circuit
+        :param error_rate_threshold: error rate opening the circuit, checked
+            once at least 1 / smoothing operations were recorded
+        :param latency_threshold: latency in seconds opening the circuit.
+            Default: latency is not checked
+        :param cooldown: seconds before an open circuit lets a probe through
+        :param smoothing: weight of the last operation in the averages
+        :param clock: monotonic clock returning seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.latency_threshold = latency_threshold
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self._clock = clock
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, bulb):
+        """
+        :return: the :class:`BulbHealth` of bulb
+        """
+        with self._lock:
+            return self._get(bulb)
+
+    def _get(self, bulb):
+        if bulb not in self._health:
+            self._health[bulb] = BulbHealth()
+        return self._health[bulb]
+
+    def allow(self, bulb):
+        """
+        :return: True if a command can be sent to bulb. When the cooldown of
+            an open circuit is over, allows a single probe
+        """
+        with self._lock:
+            health = self._get(bulb)
+            if health.state is BreakerState.closed:
+                return True
+            if health.state is BreakerState.open and \
+                    self._clock() - health.opened_at >= self.cooldown:
+                health.state = BreakerState.half_open
+            if health.state is BreakerState.half_open and \
+                    not health.probing:
+                health.probing = True
+                return True
+            return False
+
+    def available(self, bulbs):
+        """
+        :return: the bulbs commands can be sent to, see :meth:`allow`
+        """
+        return [bulb for bulb in bulbs if self.allow(bulb)]
+
+    def record(self, result):
+        """
+        Account for the outcome of an operation
+
+        :param result: a :class:`.BulbResult`
+        """
+        with self._lock:
+            health = self._get(result.bulb)
+            failed = result.error is not None
+            health.nb_operations += 1
+            health.error_rate += self.smoothing * (failed - health.error_rate)
+            if not failed:
+                health.consecutive_failures = 0
+                health.latency = result.latency if health.latency is None \
+                    else health.latency + self.smoothing * (
+                        result.latency - health.latency)
+            else:
+                health.consecutive_failures += 1
+            self._update_breaker(result.bulb, health, failed)
+
+    def record_connect(self, report):
+        """
+        Account for a connection attempt
+
+        :param report: a :class:`.ConnectReport`
+        """
+        with self._lock:
+            health = self._get(report.bulb)
+            if not report.connected:
+                health.consecutive_failures += 1
+                self._update_breaker(report.bulb, health, True)
+                return
+            if health.connects:
+                health.reconnects += 1
+            health.connects += 1
+            health.consecutive_failures = 0
+            self._update_breaker(report.bulb, health, False)
+
+    def record_disconnect(self, event):
+        """
+        Account for a :class:`.Disconnect` event. Lost connections count as
+        failures
+        """
+        if event.reason != 'lost':
+            return
+        with self._lock:
+            health = self._get(event.bulb)
+            health.disconnects += 1
+            health.consecutive_failures += 1
+            self._update_breaker(event.bulb, health, True)
+
+    def record_rssi(self, bulb, rssi):
+        """
+        Store the last signal strength measured for bulb, in dBm. bluepy
+        doesn't give the RSSI of a connection, it comes from scans, see
+        :meth:`record_scan`
+        """
+        with self._lock:
+            self._get(bulb).rssi = rssi
+
+    def record_scan(self, bulbs, devices):
+        """
+        Record the signal strength of bulbs from scan results. Bulbs don't
+        advertise while connected, so only the disconnected ones are
+        usually found
+
+        :param bulbs: list of :class:`.MagicBlue`
+        :param devices: iterable of :class:`.DiscoveredDevice`, as given by
+            :func:`.scan`. Consumed until all bulbs were seen
+        :return: the bulbs whose RSSI was recorded
+        """
+        by_mac = {bulb.mac_address.lower(): bulb for bulb in bulbs}
+        found = []
+        for device in devices:
+            bulb = by_mac.pop(device.mac_address.lower(), None)
+            if bulb is not None and device.rssi is not None:
+                self.record_rssi(bulb, device.rssi)
+                found.append(bulb)
+            if not by_mac:
+                break
+        return found
+
+    def watch(self, source):
+        """
+        Record the disconnections of an :class:`.EventSource` (a bulb or a
+        fleet)
+
+        :return: a function to call to stop watching
+        """
+        return source.on_disconnect(self.record_disconnect)
+
+    def _unhealthy(self, health):
+        if health.consecutive_failures >= self.failure_threshold:
+            return True
+        if health.nb_operations * self.smoothing >= 1 and \
+                health.error_rate >= self.error_rate_threshold:
+            return True
+        return self.latency_threshold is not None and \
+            health.latency is not None and \
+            health.latency >= self.latency_threshold
+
+    def _update_breaker(self, bulb, health, failed):
+        if health.state is BreakerState.half_open and health.probing:
+            health.probing = False
+            if failed:
+                self._open(bulb, health)
+            else:
+                logger.info('{} is back'.format(bulb))
+                health.state = BreakerState.closed
+                health.error_rate = 0.0
+                health.latency = None
+        elif health.state is BreakerState.closed and self._unhealthy(health):
+            self._open(bulb, health)
+
+    def _open(self, bulb, health):
+        logger.warning('{} is unhealthy, skipping it for {}s'.format(
+            bulb, self.cooldown))
+        health.state = BreakerState.open
+        health.opened_at = self._clock()
@@ -10,13 +10,29 @@
 import functools
 import logging
 import random
-from datetime import datetime, date, time
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, date, time, timedelta
 from enum import Enum
+from time import monotonic, sleep
 
 from bluepy import btle
 
+try:
+    from magicblue.colors import parse_color
+    from magicblue.events import EventBus, EventSource, StateChange, \
+        ScheduleChange, Disconnect, diff_state, diff_schedule, \
+        STATE_CHANGE, SCHEDULE, DISCONNECT
+except ImportError:
+    from colors import parse_color
+    from events import EventBus, EventSource, StateChange, \
+        ScheduleChange, Disconnect, diff_state, diff_schedule, \
+        STATE_CHANGE, SCHEDULE, DISCONNECT
 
-__all__ = ['MagicBlue', 'Effect']
+
+__all__ = ['MagicBlue', 'Effect', 'DeviceInfo', 'TimerItem', 'Schedule',
+           'ProtocolError', 'ConnectFailure', 'backoff_delay', 'Lane']
 
 
 logger = logging.getLogger(__name__)
@@ -27,16 +43,130 @@ UUID_CHARACTERISTIC_WRITE = btle.UUID('ffe9')
 UUID_CHARACTERISTIC_DEVICE_NAME = btle.UUID('2a00')
 
 
-def connection_required(func):
+class Lane(Enum):
+    """
+    Priority of the commands sent to a bulb
+    """
+    interactive = 0  #: state changes asked by a user, sent first
+    background = 1   #: bulk transfers and polls
+
+
+class PriorityLock:
+    """
+    Reentrant lock guarding the connection to a bulb. When it is released,
+    callers waiting in the interactive lane get it before the ones waiting
+    in the background lane. Usable as the lock of a threading.Condition.
+    """
+
+    def __init__(self):
+        self._state = threading.Condition(threading.Lock())
+        self._owner = None
+        self._count = 0
+        self._lane = None
+        self._waiting = {lane: 0 for lane in Lane}
+
+    def _free_for(self, lane):
+        return self._owner is None and not any(
+            self._waiting[other] for other in Lane if other.value < lane.value)
+
+    def _overtaken(self):
+        return any(self._waiting[other] for other in Lane
+                   if other.value < self._lane.value)
+
+    def acquire(self, blocking=True, timeout=-1, lane=Lane.interactive):
+        me = threading.get_ident()
+        with self._state:
+            if self._owner == me:
+                self._count += 1
+                return True
+            if not self._free_for(lane):
+                if not blocking:
+                    return False
+                self._waiting[lane] += 1
+                try:
+                    acquired = self._state.wait_for(
+                        lambda: self._free_for(lane),
+                        None if timeout < 0 else timeout)
+                finally:
+                    self._waiting[lane] -= 1
+                    self._state.notify_all()
+                if not acquired:
+                    return False
+            self._owner, self._count, self._lane = me, 1, lane
+            return True
+
+    def release(self):
+        with self._state:
+            if self._owner != threading.get_ident():
+                raise RuntimeError('cannot release un-acquired lock')
+            self._count -= 1
+            if not self._count:
+                self._owner = self._lane = None
+                self._state.notify_all()
+
+    @contextmanager
+    def lane(self, lane):
+        """
+        Hold the lock, waiting in the given :class:`Lane`
+        """
+        self.acquire(lane=lane)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def yield_to_urgent(self):
+        """
+        If callers of a more urgent lane are waiting, let them run then take
+        the lock back
+
+        :return: True if the lock was given away
+        """
+        with self._state:
+            if self._owner != threading.get_ident() or not self._overtaken():
+                return False
+        self._acquire_restore(self._release_save())
+        return True
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+    # Used by threading.Condition to release all the recursion levels
+    def _is_owned(self):
+        return self._owner == threading.get_ident()
+
+    def _release_save(self):
+        with self._state:
+            saved = (self._count, self._lane)
+            self._owner, self._count, self._lane = None, 0, None
+            self._state.notify_all()
+        return saved
+
+    def _acquire_restore(self, saved):
+        count, lane = saved
+        self.acquire(lane=lane)
+        with self._state:
+            self._count = count
+
+
+def connection_required(func=None, lane=Lane.interactive):
     """Raise an exception before calling the actual function if the device is
-    not connected.
+    not connected. The connection is locked during the call, waiting in the
+    given :class:`Lane`.
     """
+    if func is None:
+        return functools.partial(connection_required, lane=lane)
+
     @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
-        if self._connection is None:
-            raise Exception("Not connected")
+        with self._lock.lane(lane):
+            if self._connection is None:
+                raise Exception("Not connected")
 
-        return func(self, *args, **kwargs)
+            return func(self, *args, **kwargs)
 
     return wrapper
 
@@ -62,6 +192,44 @@ def _figure_addr_type(mac_address=None, version=None, addr_type=None):
     return btle.ADDR_TYPE_RANDOM
 
 
+class ProtocolError(ValueError):
+    """
+    A frame received from the bulb is malformed
+    """
+
+
+class ConnectFailure(Enum):
+    """
+    Why the last connection attempt to a bulb failed
+    """
+    timeout = 'timeout'                  #: no answer within the timeout
+    unreachable = 'unreachable'          #: bulb off, out of range or busy
+    adapter = 'adapter'                  #: bluepy-helper or adapter error
+    invalid_address = 'invalid_address'  #: malformed MAC or address type
+
+    @classmethod
+    def from_exception(cls, exception):
+        if isinstance(exception, TimeoutError):
+            return cls.timeout
+        if isinstance(exception, ValueError):
+            return cls.invalid_address
+        if isinstance(exception, btle.BTLEException) and exception.code in (
+                btle.BTLEException.DISCONNECTED,
+                btle.BTLEException.COMM_ERROR,
+                btle.BTLEException.GATT_ERROR):
+            return cls.unreachable
+        return cls.adapter
+
+
+def backoff_delay(attempt, backoff):
+    """
+    :return: seconds to wait before retry number attempt (starting at 1):
+        backoff doubled at each retry, with +/-25% jitter so that bulbs
+        failing together don't retry together
+    """
+    return backoff * 2 ** (attempt - 1) * random.uniform(0.75, 1.25)
+
+
 class Effect(Enum):
     """
     An enum of all the possible effects the bulb can accept
@@ -101,17 +269,194 @@ class Weekday(Enum):
     sunday = 0x80
 
 
-class MagicBlue:
+def _effect_or_none(effect_no):
+    try:
+        return Effect(effect_no)
+    except ValueError:
+        return None
+
+
+class DeviceInfo(namedtuple('DeviceInfo', [
+        'device_type', 'on', 'effect_no', 'effect_speed', 'r', 'g', 'b',
+        'brightness', 'version'])):
+    """
+    Device info reported by a bulb, decoded straight from the notification
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        return tuple.__new__(cls, (buffer[1], buffer[2] == 0x23, buffer[3],
+                                   buffer[5], buffer[6], buffer[7],
+                                   buffer[8], buffer[9], buffer[10]))
+
+    @property
+    def effect(self):
+        """The running :class:`Effect`, or None"""
+        return _effect_or_none(self.effect_no)
+
+    def as_dict(self):
+        """
+        :return: the dict returned by :meth:`Protocol.decode_device_info`
+        """
+        info = dict(zip(self._fields, self))
+        info['effect'] = self.effect
+        return info
+
+
+class TimerItem(namedtuple('TimerItem', [
+        'used', 'year', 'month', 'day', 'hour', 'minute', 'second', 'repeat',
+        'effect_no', 'effect_speed', 'r', 'g', 'b', 'on'])):
+    """
+    A slot of the time schedule, as raw values. repeat is the bitmask of
+    :class:`Weekday` values.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_buffer(cls, buffer, offset=0):
+        b = buffer
+        return tuple.__new__(cls, (b[offset] == 0xF0, b[offset + 1],
+                                   b[offset + 2], b[offset + 3],
+                                   b[offset + 4], b[offset + 5],
+                                   b[offset + 6], b[offset + 7],
+                                   b[offset + 8], b[offset + 9],
+                                   b[offset + 10], b[offset + 11],
+                                   b[offset + 12], b[offset + 13] == 0xF0))
+
+    @property
+    def time(self):
+        """Time of a repeated timer, None for a one-time timer"""
+        if self.month != 0:
+            return None
+        return time(self.hour, self.minute, self.second)
+
+    @property
+    def date_time(self):
+        """Date/time of a one-time timer, None for a repeated timer"""
+        if self.month == 0:
+            return None
+        return datetime(2000 + self.year, self.month, self.day,
+                        self.hour, self.minute, self.second)
+
+    @property
+    def weekdays(self):
+        """Set of :class:`Weekday` the timer repeats on"""
+        return {weekday for weekday in Weekday if weekday.value & self.repeat}
+
+    @property
+    def effect(self):
+        """The :class:`Effect` to start, or None"""
+        return _effect_or_none(self.effect_no)
+
+    def as_dict(self):
+        """
+        :return: the dict format used by :meth:`MagicBlue.set_time_schedule`
+        """
+        if not self.used:
+            return {'used': False}
+
+        timer_info = {'used': True}
+        if self.month == 0:
+            timer_info['time'] = self.time
+            timer_info['repeat'] = self.weekdays
+        else:
+            timer_info['date_time'] = self.date_time
+
+        effect = self.effect
+        if effect is not None:
+            timer_info['effect'] = effect
+            timer_info['effect_speed'] = self.effect_speed
+        else:
+            timer_info['r'] = self.r
+            timer_info['g'] = self.g
+            timer_info['b'] = self.b
+
+        timer_info['turn'] = 'on' if self.on else 'off'
+        return timer_info
+
+    def to_bytes(self):
+        """
+        :return: the 14 bytes of the slot in a time schedule message
+        """
+        return bytearray([0xF0 if self.used else 0x0F]) + \
+            bytearray(self[1:13]) + bytearray([0xF0 if self.on else 0x0F])
+
+
+class Schedule(tuple):
+    """
+    The 6 :class:`TimerItem` of a bulb's time schedule
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        return tuple.__new__(cls, (TimerItem.from_buffer(buffer, 1 + i * 14)
+                                   for i in range(6)))
+
+    def as_list(self):
+        """
+        :return: the list returned by :meth:`Protocol.decode_time_schedule`
+        """
+        return [item.as_dict() for item in self]
+
+    def replace(self, index, timer_item):
+        """
+        :param index: slot to replace, 0..5
+        :param timer_item: the new slot, in the dict format used by
+            :meth:`MagicBlue.set_time_schedule`
+        :return: a new :class:`Schedule`
+        """
+        Protocol.validate_timer_item(timer_item)
+        items = list(self)
+        items[index] = TimerItem.from_buffer(
+            Protocol._encode_timer_item(timer_item))
+        return tuple.__new__(Schedule, items)
+
+    def encode(self):
+        """
+        :return: the message setting this schedule, see
+            :meth:`Protocol.encode_set_time_schedule`
+        """
+        msg = bytearray([0x23])
+        for item in self:
+            msg += item.to_bytes()
+        return msg + bytearray([0x00, 0x32])
+
+
+class MagicBlue(EventSource):
     """
     Class to interface with Magic Blue light
     """
 
-    def __init__(self, mac_address, version=7, addr_type=None):
+    def __init__(self, mac_address, version=7, addr_type=None,
+                 peripheral_factory=None, clock=monotonic):
         """
         :param mac_address: device MAC address as a string
         :param version: bulb version as displayed in official app (integer)
+        :param peripheral_factory: function(mac_address, addr_type, adapter)
+            returning a connected peripheral. Default: bluepy's Peripheral.
+            See :mod:`.replay` for recording and replaying transports
+        :param clock: monotonic clock returning seconds, used for reply
+            timeouts and the age of cached data. Must follow the time of
+            the peripheral's waitForNotifications, see :mod:`.simulator`
         """
         self._connection = None
+        # Characteristics of the connection, by UUID
+        self._characteristics = {}
+        self._peripheral_factory = peripheral_factory or btle.Peripheral
+        self._clock = clock
+        # Connection is shared by callers and notification pumps
+        self._lock = PriorityLock()
+        self._reply = threading.Condition(self._lock)
+        self._pumped = False
+        self._notification_listeners = []
+        self.events = EventBus()
+        #: :class:`ConnectFailure` of the last connect() call, None if it
+        #: succeeded
+        self.connect_failure = None
+        #: Exception behind connect_failure
+        self.connect_error = None
 
         self.mac_address = mac_address
         self.version = version
@@ -119,44 +464,125 @@ class MagicBlue:
 
         self.__time_schedule_buffer = None
 
-        self._device_info = {}
+        self._device_info = None
         self._date_time = None
-        self._time_schedule = []
+        self._time_schedule = None
+        # Clock time the cached time schedule was received or written
+        self._time_schedule_at = None
 
-    def connect(self, bluetooth_adapter_nr=0):
+    def connect(self, bluetooth_adapter_nr=0, timeout=None, retries=0,
+                backoff=1.0):
         """
-        Connect to device
+        Connect to device. On failure, the reason is in
+        :attr:`connect_failure`.
         
         :param bluetooth_adapter_nr: bluetooth adapter name as shown by
             "hciconfig" command. Default : 0 for (hci0)
+        :param timeout: seconds to wait for each attempt. Default: no
+            timeout
+        :param retries: attempts after the first one failed. Invalid
+            addresses are never retried
+        :param backoff: seconds to wait before the first retry, doubled at
+            each retry (see :func:`backoff_delay`)
         
         :return: True if connection succeed, False otherwise
         """
+        for attempt in range(retries + 1):
+            if attempt:
+                sleep(backoff_delay(attempt, backoff))
+            if self.connect_once(bluetooth_adapter_nr, timeout):
+                return True
+            if self.connect_failure is ConnectFailure.invalid_address:
+                break
+        return False
+
+    def connect_once(self, bluetooth_adapter_nr=0, timeout=None):
+        """
+        Make a single connection attempt, see :meth:`connect`
+        """
         logger.debug("Connecting...")
 
         try:
-            connection = btle.Peripheral(self.mac_address, self._addr_type,
-                                         bluetooth_adapter_nr)
-            self._connection = connection.withDelegate(self)
-            self._subscribe_to_recv_characteristic()
-        except RuntimeError as e:
-            logger.error('Connection failed : {}'.format(e))
+            connection = self._create_connection(bluetooth_adapter_nr,
+                                                 timeout)
+            with self._lock:
+                self._connection = connection.withDelegate(self)
+                self._characteristics = {}
+                try:
+                    self._subscribe_to_recv_characteristic()
+                except Exception:
+                    self._connection = None
+                    connection.disconnect()
+                    raise
+        except (RuntimeError, OSError, ValueError, btle.BTLEException) as e:
+            self.connect_failure = ConnectFailure.from_exception(e)
+            self.connect_error = e
+            logger.error('Connection to {} failed ({}): {}'.format(
+                self.mac_address, self.connect_failure.value, e))
             return False
 
+        self.connect_failure = None
+        self.connect_error = None
         return True
 
+    def _create_connection(self, bluetooth_adapter_nr, timeout):
+        """
+        Call the peripheral factory, giving up after timeout seconds. The
+        factory can't be interrupted: it keeps running in a thread and a
+        connection it makes too late is closed.
+        """
+        args = (self.mac_address, self._addr_type, bluetooth_adapter_nr)
+        if timeout is None:
+            return self._peripheral_factory(*args)
+
+        outcome = {}
+        guard = threading.Lock()
+
+        def create():
+            try:
+                connection = self._peripheral_factory(*args)
+            except Exception as e:
+                with guard:
+                    outcome.setdefault('error', e)
+                return
+            with guard:
+                if 'error' not in outcome:
+                    outcome['connection'] = connection
+                    return
+            logger.debug('Closing late connection to {}'.format(
+                self.mac_address))
+            try:
+                connection.disconnect()
+            except btle.BTLEException:
+                pass
+
+        thread = threading.Thread(target=create, daemon=True,
+                                  name='connect-{}'.format(self.mac_address))
+        thread.start()
+        thread.join(timeout)
+        with guard:
+            outcome.setdefault('error', TimeoutError(
+                'No connection after {}s'.format(timeout)))
+            if 'connection' in outcome:
+                return outcome['connection']
+        raise outcome['error']
+
     def disconnect(self):
         """
         Disconnect from device
         """
         logger.debug("Disconnecting...")
 
-        try:
-            self._connection.disconnect()
-        except btle.BTLEException:
-            pass
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._connection.disconnect()
+            except btle.BTLEException:
+                pass
 
-        self._connection = None
+            self._connection = None
+        self.events.emit(DISCONNECT, Disconnect(self, 'requested'))
 
     def is_connected(self):
         """
@@ -181,12 +607,49 @@ class MagicBlue:
             return False
         except BrokenPipeError:
             # bluepy-helper died
-            self._connection = None
+            self._connection_lost()
             return False
 
         return True
 
+    def process_notifications(self, timeout=0.001):
+        """
+        Handle the notifications the bulb already sent. Called by
+        :class:`.NotificationPump`, or by hand when no pump is running.
+
+        :param timeout: how long to wait for a first notification, in seconds
+        :return: number of notifications handled
+        """
+        count = 0
+        with self._lock.lane(Lane.background):
+            try:
+                while self._connection is not None and \
+                        self._connection.waitForNotifications(timeout):
+                    count += 1
+            except (btle.BTLEException, BrokenPipeError):
+                self._connection_lost()
+                raise
+        return count
+
     @connection_required
+    def send_frames(self, frames):
+        """
+        Write encoded messages (see :class:`Protocol`) one after the other,
+        without letting other commands in between
+
+        :param frames: list of messages
+        :raises Exception: if not connected. When the connection is lost
+            while writing, a :class:`.Disconnect` event is emitted before the
+            error is raised
+        """
+        try:
+            for frame in frames:
+                self._send(frame)
+        except (btle.BTLEException, BrokenPipeError):
+            self._connection_lost()
+            raise
+
+    @connection_required(lane=Lane.background)
     def get_device_name(self):
         """
         :return: Device name
@@ -206,17 +669,18 @@ class MagicBlue:
         """
         brightness = int(intensity * 255)
         msg = Protocol.encode_set_brightness(brightness)
-        self._send_characteristic.write(msg)
+        self._send(msg)
 
     @connection_required
     def set_color(self, rgb_color):
         """
         Change bulb's color
         
-        :param rgb_color: color as a list of 3 values between 0 and 255
+        :param rgb_color: color as a list of 3 values between 0 and 255, or
+            any string accepted by :func:`.colors.parse_color`
         """
-        msg = Protocol.encode_set_rgb(*rgb_color)
-        self._send_characteristic.write(msg)
+        msg = Protocol.encode_set_rgb(*parse_color(rgb_color))
+        self._send(msg)
 
     @connection_required
     def set_random_color(self):
@@ -231,7 +695,7 @@ class MagicBlue:
         Turn off the light
         """
         msg = Protocol.encode_turn_off()
-        self._send_characteristic.write(msg)
+        self._send(msg)
 
     @connection_required
     def turn_on(self, brightness=None):
@@ -242,38 +706,57 @@ class MagicBlue:
             brightness
         """
         msg = Protocol.encode_turn_on()
-        self._send_characteristic.write(msg)
+        self._send(msg)
 
         if brightness is not None:
             self.set_warm_light(brightness)
 
-    @connection_required
-    def get_device_info(self):
+    @connection_required(lane=Lane.background)
+    def get_device_info(self, timeout=None):
         """
         Retrieve device info
+
+        :param timeout: if given, wait up to timeout seconds for the bulb to
+            answer. Otherwise the last received device info is returned
+        :raises TimeoutError: if the bulb didn't answer in time
         """
         msg = Protocol.encode_request_device_info()
-        self._send_characteristic.write(msg, True)
+        info = self._request(msg, '_device_info', timeout)
+        return info.as_dict() if info is not None else {}
+
+    @property
+    def device_info(self):
+        """
+        Last :class:`DeviceInfo` received from the bulb, None if none yet
+        """
         return self._device_info
 
-    @connection_required
-    def set_date_time(self, datetime_value):
+    @connection_required(lane=Lane.background)
+    def set_date_time(self, datetime_value=None, offset=0.0):
         """
         Set date/time in bulb
         
-        :param datetime_value: datetime to set
+        :param datetime_value: datetime to set. Default: the current time,
+            taken right before the message is sent
+        :param offset: seconds added to the current time when datetime_value
+            is not given, to account for the time the write takes
         """
+        if datetime_value is None:
+            datetime_value = datetime.now() + timedelta(seconds=offset)
         msg = Protocol.encode_set_date_time(datetime_value)
-        self._send_characteristic.write(msg)
+        self._send(msg)
 
-    @connection_required
-    def get_date_time(self):
+    @connection_required(lane=Lane.background)
+    def get_date_time(self, timeout=None):
         """
         Retrieve date/time from bulb
+
+        :param timeout: if given, wait up to timeout seconds for the bulb to
+            answer. Otherwise the last received date/time is returned
+        :raises TimeoutError: if the bulb didn't answer in time
         """
         msg = Protocol.encode_request_date_time()
-        self._send_characteristic.write(msg, True)
-        return self._date_time
+        return self._request(msg, '_date_time', timeout)
 
     @connection_required
     def set_effect(self, effect, effect_speed):
@@ -286,18 +769,29 @@ class MagicBlue:
         """
         effect_no = effect.value
         msg = Protocol.encode_set_effect(effect_no, effect_speed)
-        self._send_characteristic.write(msg)
+        self._send(msg)
 
-    @connection_required
-    def get_time_schedule(self):
+    @connection_required(lane=Lane.background)
+    def get_time_schedule(self, timeout=None):
         """
         Request the time schedule
+
+        :param timeout: if given, wait up to timeout seconds for the bulb to
+            answer. Otherwise the last received time schedule is returned
+        :raises TimeoutError: if the bulb didn't answer in time
         """
         msg = Protocol.encode_request_time_schedule()
-        self._send_characteristic.write(msg, True)
+        schedule = self._request(msg, '_time_schedule', timeout)
+        return schedule.as_list() if schedule is not None else []
+
+    @property
+    def time_schedule(self):
+        """
+        Last :class:`Schedule` received from the bulb, None if none yet
+        """
         return self._time_schedule
 
-    @connection_required
+    @connection_required(lane=Lane.background)
     def set_time_schedule(self, timer_items):
         """
         Set the time schedule
@@ -317,63 +811,190 @@ class MagicBlue:
             - b, 0..255
             
         **date_time and time+repeat are exclusive**
+
+        The fragments of the schedule are sent while holding the connection,
+        so no other command can be interleaved with them.
+
+        :raises ValueError: if an item is invalid, before anything is sent
         """
         if len(timer_items) > 6:
-            raise Exception("Maximum of 6 TimerItems allowed")
+            raise ValueError("Maximum of 6 TimerItems allowed")
+        for timer_item in timer_items:
+            Protocol.validate_timer_item(timer_item)
+
+        msg = Protocol.encode_set_time_schedule(list(timer_items))
+        self._send_time_schedule(Schedule.from_buffer(msg), msg)
+
+    @connection_required(lane=Lane.background)
+    def cached_time_schedule(self, max_age=60.0, timeout=2.0):
+        """
+        The time schedule last received from or written to the bulb, read
+        again if older than max_age
+
+        :param max_age: seconds the cached schedule stays valid, None to
+            always use it when there is one
+        :param timeout: how long to wait for the bulb to answer, in seconds
+        :return: a :class:`Schedule`
+        :raises TimeoutError: if the schedule had to be read and the bulb
+            didn't answer in time
+        """
+        if self._time_schedule is None or (
+                max_age is not None and
+                self._clock() - self._time_schedule_at > max_age):
+            self.get_time_schedule(timeout)
+        return self._time_schedule
+
+    @connection_required(lane=Lane.background)
+    def update_timer_slot(self, index, timer_item, max_age=60.0,
+                          timeout=2.0):
+        """
+        Change a single slot of the time schedule, keeping the others as in
+        :meth:`cached_time_schedule`. The bulb only accepts whole schedules,
+        so all the slots are written.
+
+        :param index: slot to change, 0..5
+        :param timer_item: the new slot, see :meth:`set_time_schedule`
+        :raises ValueError: if index or timer_item are invalid, before
+            anything is sent
+        """
+        if not 0 <= index < 6:
+            raise ValueError('Timer slot must be in 0..5, got {}'
+                             .format(index))
+        Protocol.validate_timer_item(timer_item)
+        schedule = self.cached_time_schedule(max_age, timeout)
+        schedule = schedule.replace(index, timer_item)
+        self._send_time_schedule(schedule, schedule.encode())
+
+    def clear_timer_slot(self, index, max_age=60.0, timeout=2.0):
+        """
+        Disable a slot of the time schedule, see :meth:`update_timer_slot`
+        """
+        self.update_timer_slot(index, {'used': False}, max_age, timeout)
 
+    def _send_time_schedule(self, schedule, msg):
         # send message by 20 bytes at a time
-        msg = Protocol.encode_set_time_schedule(timer_items)
         while msg:
             sub_msg = msg[0:20]
-            self._send_characteristic.write(sub_msg)
+            self._send(sub_msg)
             msg = msg[20:]
+        self._time_schedule = schedule
+        self._time_schedule_at = self._clock()
+
+    def _send(self, msg, with_response=False):
+        self._send_characteristic.write(msg, with_response)
+
+    def _request(self, msg, attribute, timeout):
+        """Send a request and wait for the notification updating attribute"""
+        previous = getattr(self, attribute)
+        self._send(msg, True)
+        if timeout is None:
+            return previous
+
+        deadline = self._clock() + timeout
+        while getattr(self, attribute) is previous:
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                raise TimeoutError('No reply from {}'.format(self))
+            if self._pumped:
+                self._reply.wait(remaining)
+            else:
+                # Short waits, to let interactive commands go in between
+                self._connection.waitForNotifications(min(remaining, 0.1))
+                if self._lock.yield_to_urgent() and self._connection is None:
+                    raise Exception("Not connected")
+        return getattr(self, attribute)
+
+    def _connection_lost(self):
+        with self._lock:
+            if self._connection is None:
+                return
+            self._connection = None
+        self.events.emit(DISCONNECT, Disconnect(self, 'lost'))
+
+    def _publish(self, kind, value, previous):
+        """Wake up callers waiting for a reply and inform listeners"""
+        with self._reply:
+            self._reply.notify_all()
+            listeners = list(self._notification_listeners)
+        for listener in listeners:
+            listener(self, kind, value)
+
+        if kind == 'device_info' and self.events.has_subscribers(
+                STATE_CHANGE):
+            changed = diff_state(previous, value)
+            if changed:
+                self.events.emit(STATE_CHANGE,
+                                 StateChange(self, previous, value, changed))
+        elif kind == 'time_schedule' and self.events.has_subscribers(
+                SCHEDULE):
+            changed = diff_schedule(previous, value)
+            if changed:
+                self.events.emit(SCHEDULE,
+                                 ScheduleChange(self, previous, value,
+                                                changed))
 
     def handleNotification(self, handle, buffer):
         logger.debug("Got notification, handle: {}, buffer: {}".format(handle,
                                                                        buffer))
 
-        if len(buffer) >= 11 and buffer[0] == 0x66 and buffer[11] == 0x99:
-            self._device_info = Protocol.decode_device_info(buffer)
-        elif len(buffer) >= 10 and buffer[0] == 0x13 and buffer[10] == 0x31:
-            self._date_time = Protocol.decode_date_time(buffer)
-        elif len(buffer) >= 20 and buffer[0] == 0x25:  # start time_schedule
-            self.__time_schedule_buffer = bytearray(buffer)
-        elif self.__time_schedule_buffer is not None:  # reading time_schedule
-            self.__time_schedule_buffer += buffer
-            if len(self.__time_schedule_buffer) >= 87:
-                self._time_schedule = Protocol.decode_time_schedule(
-                        self.__time_schedule_buffer)
-                self.__time_schedule_buffer = None
+        # Frames are checked before being decoded: a malformed frame is
+        # dropped instead of raising in the notification thread
+        try:
+            if len(buffer) >= 12 and buffer[0] == 0x66 and buffer[11] == 0x99:
+                previous = self._device_info
+                self._device_info = DeviceInfo.from_buffer(buffer)
+                self._publish('device_info', self._device_info, previous)
+            elif len(buffer) >= 11 and buffer[0] == 0x13 and \
+                    buffer[10] == 0x31:
+                previous = self._date_time
+                self._date_time = Protocol.decode_date_time(buffer,
+                                                            strict=True)
+                self._publish('date_time', self._date_time, previous)
+            elif len(buffer) >= 20 and buffer[0] == 0x25:  # start schedule
+                self.__time_schedule_buffer = bytearray(buffer)
+            elif self.__time_schedule_buffer is not None:  # reading schedule
+                self.__time_schedule_buffer += buffer
+                if len(self.__time_schedule_buffer) >= 87:
+                    schedule_buffer = self.__time_schedule_buffer
+                    self.__time_schedule_buffer = None
+                    Protocol.check_time_schedule(schedule_buffer)
+                    previous = self._time_schedule
+                    self._time_schedule = Schedule.from_buffer(
+                            schedule_buffer)
+                    self._time_schedule_at = self._clock()
+                    self._publish('time_schedule', self._time_schedule,
+                                  previous)
+        except ProtocolError as e:
+            logger.warning('Dropped malformed frame from {}: {}'.format(
+                self, e))
 
     def __str__(self):
         return "<MagicBlue({}, {})>".format(self.mac_address, self.version)
 
+    def _characteristic(self, uuid):
+        """Get a BTLE characteristic, discovered once per connection"""
+        characteristic = self._characteristics.get(uuid)
+        if characteristic is None:
+            characteristics = self._connection.getCharacteristics(uuid=uuid)
+            if not characteristics:
+                return None
+            characteristic = self._characteristics[uuid] = characteristics[0]
+        return characteristic
+
     @property
     def _send_characteristic(self):
         """Get BTLE characteristic for sending commands"""
-        characteristics = self._connection.getCharacteristics(
-                uuid=UUID_CHARACTERISTIC_WRITE)
-        if not characteristics:
-            return None
-        return characteristics[0]
+        return self._characteristic(UUID_CHARACTERISTIC_WRITE)
 
     @property
     def _recv_characteristic(self):
         """Get BTLE characteristic for receiving data"""
-        characteristics = self._connection.getCharacteristics(
-                uuid=UUID_CHARACTERISTIC_RECV)
-        if not characteristics:
-            return None
-        return characteristics[0]
+        return self._characteristic(UUID_CHARACTERISTIC_RECV)
 
     @property
     def _device_name_characteristic(self):
         """Get BTLE characteristic for reading device name"""
-        characteristics = self._connection.getCharacteristics(
-                uuid=UUID_CHARACTERISTIC_DEVICE_NAME)
-        if not characteristics:
-            return None
-        return characteristics[0]
+        return self._characteristic(UUID_CHARACTERISTIC_DEVICE_NAME)
 
     def _subscribe_to_recv_characteristic(self):
         char = self._recv_characteristic
@@ -437,6 +1058,37 @@ class Protocol:
         """
         return bytearray([0xBB, effect_no, effect_speed, 0x44])
 
+    @staticmethod
+    def validate_timer_item(timer_item):
+        """
+        Raise ValueError if timer_item can't be sent to a bulb, see
+        :meth:`MagicBlue.set_time_schedule` for the expected format
+        """
+        if not timer_item.get('used'):
+            return
+        if ('date_time' in timer_item) == ('time' in timer_item):
+            raise ValueError('Timer item needs either date_time or time: {}'
+                             .format(timer_item))
+        if 'date_time' in timer_item:
+            if 'repeat' in timer_item:
+                raise ValueError('date_time and repeat are exclusive')
+            if not 2000 <= timer_item['date_time'].year <= 2255:
+                raise ValueError('Timer year must be in 2000..2255')
+        if not set(timer_item.get('repeat', ())) <= set(Weekday):
+            raise ValueError('repeat must be a set of Weekday')
+        if timer_item.get('turn') not in ('on', 'off'):
+            raise ValueError("turn must be 'on' or 'off'")
+        if timer_item['turn'] == 'off':
+            return
+        if 'effect' in timer_item:
+            if not isinstance(timer_item['effect'], Effect):
+                raise ValueError('effect must be an Effect')
+            if not 1 <= timer_item.get('effect_speed', 0) <= 20:
+                raise ValueError('effect_speed must be in 1..20')
+        for color in ('r', 'g', 'b'):
+            if not 0 <= timer_item.get(color, -1) <= 255:
+                raise ValueError('{} must be in 0..255'.format(color))
+
     @staticmethod
     def encode_set_time_schedule(timer_items):
         """
@@ -523,34 +1175,75 @@ class Protocol:
         return bytearray([0x24, 0x2A, 0x2B, 0x42])
 
     @staticmethod
-    def decode_device_info(buffer):
+    def check_device_info(buffer):
+        """
+        Raise :class:`ProtocolError` if buffer isn't a device info message
+        """
+        if len(buffer) < 12 or buffer[0] != 0x66 or buffer[11] != 0x99:
+            raise ProtocolError('Invalid device info: {}'.format(buffer))
+
+    @staticmethod
+    def check_date_time(buffer):
+        """
+        Raise :class:`ProtocolError` if buffer isn't a valid date/time
+        message
+        """
+        if len(buffer) < 11 or buffer[0] != 0x13 or buffer[10] != 0x31:
+            raise ProtocolError('Invalid date/time: {}'.format(buffer))
+        if not (1 <= buffer[3] <= 12 and 1 <= buffer[4] <= 31 and
+                buffer[5] < 24 and buffer[6] < 60 and buffer[7] < 60):
+            raise ProtocolError('Invalid date/time: {}'.format(buffer))
+
+    @staticmethod
+    def check_time_schedule(buffer):
+        """
+        Raise :class:`ProtocolError` if buffer isn't a valid time schedule
+        message
+        """
+        if len(buffer) < 85:
+            raise ProtocolError('Time schedule too short: {} bytes'
+                                .format(len(buffer)))
+        for offset in range(1, 85, 14):
+            if buffer[offset] != 0xF0:
+                continue
+            year, month, day, hour, minute, second = \
+                buffer[offset + 1:offset + 7]
+            try:
+                if month == 0:
+                    time(hour, minute, second)
+                else:
+                    datetime(2000 + year, month, day, hour, minute, second)
+            except ValueError as e:
+                raise ProtocolError('Invalid timer item at byte {}: {}'
+                                    .format(offset, e))
+
+    @staticmethod
+    def decode_device_info(buffer, strict=False):
         """
         Decode a message with device info
+
+        :param strict: check the message first, raising
+            :class:`ProtocolError` if it's malformed
         """
-        info = {
-            'device_type':  buffer[1],
-            'on':           buffer[2] == 0x23,
-            'effect_no':    buffer[3],
-            'effect':       None,
-            'effect_speed': buffer[5],
-            'r':            buffer[6],
-            'g':            buffer[7],
-            'b':            buffer[8],
-            'brightness':   buffer[9],
-            'version':      buffer[10],
-        }
-        try:
-            effect_no = info['effect_no']
-            info['effect'] = Effect(effect_no)
-        except ValueError:
-            pass
-        return info
+        if strict:
+            Protocol.check_device_info(buffer)
+        return DeviceInfo.from_buffer(buffer).as_dict()
 
     @staticmethod
-    def decode_date_time(buffer):
+    def decode_date_time(buffer, strict=False):
         """
         Decode a message with the date/time
+
+        :param strict: check the message first, raising
+            :class:`ProtocolError` if it's malformed
         """
+        if strict:
+            Protocol.check_date_time(buffer)
+            try:
+                return Protocol.decode_date_time(buffer)
+            except ValueError as e:  # eg. 31st of February
+                raise ProtocolError('Invalid date/time: {}'.format(e))
+
         year = buffer[2] + 2000
         month = buffer[3]
         day = buffer[4]
@@ -564,56 +1257,13 @@ class Protocol:
         return datetime.combine(date_, time_)
 
     @staticmethod
-    def decode_time_schedule(buffer):
+    def decode_time_schedule(buffer, strict=False):
         """
         Decode a message with the time schedule
-        """
-        time_schedule = []
-
-        base = 1
-        for i in range(0, 6):
-            offset = base + i * 14
-            sub_buffer = buffer[offset:offset + 14]
-            timer_info = Protocol._decode_timer_item(sub_buffer)
 
-            time_schedule += [timer_info]
-
-        return time_schedule
-
-    @staticmethod
-    def _decode_timer_item(buffer):
-        timer_info = {}
-        timer_info['used'] = buffer[0] == 0xF0
-        if not timer_info['used']:
-            return timer_info
-
-        year = buffer[1]
-        month = buffer[2]
-        day = buffer[3]
-        hour = buffer[4]
-        minute = buffer[5]
-        second = buffer[6]
-        if month == 0:
-            timer_info['time'] = time(hour, minute, second)
-            timer_info['repeat'] = set()
-            for weekday in Weekday:
-                if weekday.value & buffer[7]:
-                    timer_info['repeat'].add(weekday)
-        else:
-            timer_info['date_time'] = datetime(2000 + year, month, day,
-                                               hour, minute, second)
-
-        try:
-            timer_info['effect'] = Effect(buffer[8])
-            timer_info['effect_speed'] = buffer[9]
-        except ValueError:
-            pass
-
-        if 'effect' not in timer_info:
-            timer_info['r'] = buffer[10]
-            timer_info['g'] = buffer[11]
-            timer_info['b'] = buffer[12]
-
-        timer_info['turn'] = 'on' if buffer[13] == 0xF0 else 'off'
-
-        return timer_info
+        :param strict: check the message first, raising
+            :class:`ProtocolError` if it's malformed
+        """
+        if strict:
+            Protocol.check_time_schedule(buffer)
+        return Schedule.from_buffer(buffer).as_list()
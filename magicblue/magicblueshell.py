@@ -10,24 +10,35 @@
 # =============================================================================
 
 import argparse
+import functools
 import logging
 import os
 import sys
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pformat
 from sys import platform as _platform
 
-from webcolors import hex_to_rgb, name_to_rgb
-from bluepy.btle import Scanner, DefaultDelegate
+from bluepy.btle import BTLEException
 try:
     from magicblue.magicbluelib import MagicBlue, Effect
+    from magicblue.colors import parse_light
+    from magicblue.config import FleetConfig
+    from magicblue.fleet import fan_out
+    from magicblue.scan import scan, find, DeviceIndex, is_mac_address
     from magicblue import __version__
 except ImportError:
     from magicbluelib import MagicBlue, Effect
+    from colors import parse_light
+    from config import FleetConfig
+    from fleet import fan_out
+    from scan import scan, find, DeviceIndex, is_mac_address
     from __init__ import __version__
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for a bulb to answer a read command
+READ_TIMEOUT = 2.0
+
 
 class MagicBlueShell:
     class Cmd:
@@ -43,7 +54,8 @@ class MagicBlueShell:
 
     def __init__(self, bluetooth_adapter, bulb_version=7):
         # List available commands and their usage. 'con_required' define if
-        # we need to be connected to a device for the command to run
+        # we need to be connected to a device for the command to run. These
+        # commands return the function to call on each targeted bulb
         self.available_cmds = [
             MagicBlueShell.Cmd('help', self.list_commands, False,
                                help='Show this help'),
@@ -54,14 +66,22 @@ class MagicBlueShell:
                                help='List available effects',),
             MagicBlueShell.Cmd('connect', self.cmd_connect, False,
                                help='Connect to light bulb',
-                               params=['mac_address||ID'],
+                               params=['mac_address||ID||name'],
                                aliases=['c'],
                                opt_params=['bulb version (default 7)']),
             MagicBlueShell.Cmd('disconnect', self.cmd_disconnect, True,
                                help='Disconnect from current light bulb'),
+            MagicBlueShell.Cmd('bulbs', self.cmd_bulbs, False,
+                               help='List connected bulbs, to target them '
+                                    'with @ID, @mac, @alias or @group'),
+            MagicBlueShell.Cmd('async', self.cmd_async, False,
+                               help='Run commands in the background and '
+                                    'report each bulb as it answers',
+                               params=['on|off']),
             MagicBlueShell.Cmd('set_color', self.cmd_set_color, True,
                                help="Change bulb's color",
-                               params=['name or hexadecimal value']),
+                               params=['name|#hex|rgb(..)|hsv(..)|' +
+                                       'kelvin|warm(..)']),
             MagicBlueShell.Cmd('set_warm_light', self.cmd_set_warm_light, True,
                                help='Set warm light',
                                params=['intensity[0.0-1.0]']),
@@ -88,8 +108,33 @@ class MagicBlueShell:
         self._bulb_version = bulb_version
         self._bulbs = []
         self._devices = []
+        self._fleet = None
+        self._executor = None
         self.last_scan = None
 
+    def load_fleet(self, config_path):
+        """
+        Connect all the bulbs of a fleet config file and print how it went
+        """
+        config = FleetConfig.load(config_path)
+        self._fleet = config.create_fleet()
+        print('Connecting {} bulbs...'.format(len(self._fleet)))
+        reports = self._fleet.connect_all(config.max_parallel, config.retries)
+
+        aliases = {bulb: alias for alias, bulb in self._fleet.aliases.items()}
+        print('{: <16} {: <18} {: <15} {: >8} {: >9}'.format(
+            'Alias', 'Mac address', 'Status', 'Attempts', 'Latency'))
+        print('{: <16} {: <18} {: <15} {: >8} {: >9}'.format(
+            '-----', '-----------', '------', '--------', '-------'))
+        for report in reports:
+            print('{: <16} {: <18} {: <15} {: >8} {: >7.0f}ms'.format(
+                aliases.get(report.bulb, ''), report.bulb.mac_address,
+                'ready' if report.connected else report.failure.value,
+                report.attempts, report.latency * 1000))
+            if report.connected:
+                self._bulbs.append(report.bulb)
+        return all(report.connected for report in reports)
+
     def start_interactive_mode(self):
         print('Magic Blue interactive shell v{}'.format(__version__))
         print('Type "help" for a list of available commands')
@@ -108,17 +153,115 @@ class MagicBlueShell:
                              .format(str_cmd, str(e)))
 
     def exec_cmd(self, str_cmd):
-        cmd = self._get_command(str_cmd)
-        args = str_cmd.split()[1:]
+        """
+        Run commands separated by ";". Each command can be prefixed with
+        @selector[,selector...] to only apply to some bulbs, see
+        :meth:`_select`. In async mode, commands sent to bulbs are queued
+        in the background, in order
+        """
+        for cmd in str_cmd.split(';'):
+            if not cmd.strip():
+                continue
+            try:
+                self._exec_single(cmd.strip())
+            except Exception as e:
+                logger.error('Unexpected error with command "{}": {}'
+                             .format(cmd.strip(), str(e)))
+
+    def _exec_single(self, str_cmd):
+        # Only the main thread changes the list of bulbs, background
+        # commands leave disconnected bulbs to be pruned here
+        self._bulbs = [bulb for bulb in self._bulbs if bulb.is_connected()]
+        words = str_cmd.split()
+        targets = None
+        if words[0].startswith('@'):
+            try:
+                targets = self._select(words[0][1:])
+            except (KeyError, IndexError, ValueError) as e:
+                logger.error('Unknown bulb: {}'.format(e))
+                return
+            words = words[1:]
+            if not words:
+                logger.error('Missing command after {}'.format(str_cmd))
+                return
+
+        cmd = self._get_command(words[0])
+        args = words[1:]
         if cmd is not None:
             if cmd.conn_required and not (len(self._bulbs) > 0):
                 logger.error('You must be connected to run this command')
             elif self._check_args(cmd, args):
-                cmd.func(args)
+                if not cmd.conn_required:
+                    cmd.func(args)
+                    return
+                action = cmd.func(args)
+                if action is None:
+                    return
+                targets = list(self._bulbs) if targets is None else targets
+                if self._executor is not None:
+                    self._executor.submit(self._apply, cmd.cmd_str, action,
+                                          targets, True)
+                else:
+                    self._apply(cmd.cmd_str, action, targets)
         else:
             logger.error('"{}" is not a valid command.'
                          'Type "help" to see what you can do'
-                         .format(str_cmd.split()[0]))
+                         .format(words[0]))
+
+    def _select(self, selectors):
+        """
+        :param selectors: comma-separated IDs (as listed by "bulbs"), MAC
+            addresses, aliases or groups of the fleet
+        :return: list of the selected bulbs, among the connected ones
+        """
+        bulbs = []
+        for selector in selectors.split(','):
+            if selector.isdigit():
+                if not 1 <= int(selector) <= len(self._bulbs):
+                    raise IndexError(selector)
+                found = [self._bulbs[int(selector) - 1]]
+            else:
+                found = []
+                if self._fleet is not None:
+                    try:
+                        found = self._fleet.select(selector)
+                    except KeyError:
+                        pass
+                # Bulbs connected with "connect" aren't in the fleet
+                found = [bulb for bulb in found if bulb in self._bulbs] or \
+                    [bulb for bulb in self._bulbs
+                     if bulb.mac_address.lower() == selector.lower()]
+                if not found:
+                    raise KeyError(selector)
+            bulbs.extend(bulb for bulb in found if bulb not in bulbs)
+        return bulbs
+
+    def _apply(self, cmd_str, action, bulbs, background=False):
+        """Call action on bulbs in parallel, reporting each result"""
+        fan_out(bulbs, action,
+                on_result=functools.partial(self._report, cmd_str, background))
+
+    def _report(self, cmd_str, background, result):
+        label = self._label(result.bulb)
+        value = result.value
+        if value is not None and not isinstance(value, str):
+            value = pformat(value)
+        if result.error is not None:
+            logger.error('{} {} failed: {}'.format(label, cmd_str,
+                                                   result.error))
+        elif background:
+            print('[{}] {} done in {:.0f}ms{}'.format(
+                label, cmd_str, result.latency * 1000,
+                '' if value is None else ': {}'.format(value)))
+        elif value is not None:
+            logger.info('{}: {}'.format(label, value))
+
+    def _label(self, bulb):
+        if self._fleet is not None:
+            for alias, aliased in self._fleet.aliases.items():
+                if aliased is bulb:
+                    return alias
+        return bulb.mac_address
 
     def print_usage(self, str_cmd):
         cmd = self._get_command(str_cmd)
@@ -132,19 +275,26 @@ class MagicBlueShell:
 
     def cmd_list_devices(self, args):
         scan_time = 300
+        self.last_scan = DeviceIndex()
         try:
-            self.last_scan = ScanDelegate()
-            scanner = Scanner().withDelegate(self.last_scan)
-
             print('Listing Bluetooth LE devices in range for {} seconds. '
                   'Press CTRL+C to abort searching.'.format(scan_time))
-            print('{: <5} {: <30} {: <12}'.format('ID', 'Name', 'Mac address'))
-            print('{: <5} {: <30} {: <12}'.format('--', '----', '-----------'))
-
-            scanner.scan(scan_time)
+            print('{: <5} {: <30} {: <18} {: >5}'.format(
+                'ID', 'Name', 'Mac address', 'RSSI'))
+            print('{: <5} {: <30} {: <18} {: >5}'.format(
+                '--', '----', '-----------', '----'))
+
+            for device in scan(scan_time):
+                previous = self.last_scan.by_mac(device.mac_address)
+                dev_id, is_new = self.last_scan.add(device)
+                # Print devices again when their name arrives
+                if is_new or (device.name and not previous.name):
+                    print('{: <5} {: <30} {: <18} {: >5}{}'.format(
+                        dev_id, device.name or 'NO_NAME', device.mac_address,
+                        device.rssi, ' *' if device.is_magic_blue else ''))
         except KeyboardInterrupt:
             print('\n')
-        except RuntimeError as e:
+        except (RuntimeError, BTLEException) as e:
             logger.error('Problem with the Bluetooth adapter : {}'.format(e))
             return False
 
@@ -154,36 +304,63 @@ class MagicBlueShell:
 
     def cmd_connect(self, args):
         bulb_version = args[1] if len(args) > 1 else self._bulb_version
-        # Use can enter either a mac address or the device ID from the list
-        if len(args[0]) < 4 and self.last_scan:
+        # User can enter a mac address, or the ID or name of a device from
+        # the list. Unknown names are searched with a short scan
+        device = self.last_scan.lookup(args[0]) if self.last_scan else None
+        if device is None and not is_mac_address(args[0]) and \
+                not args[0].isdigit():
+            print('Searching {}...'.format(args[0]))
             try:
-                dev_id = int(args[0]) - 1
-                entry = self.last_scan.devices[dev_id]
-                mac_address = entry.addr
-                addr_type = entry.addrType
-            except Exception:
-                logger.error('Bad ID / MAC address : {}'.format(args[0]))
+                device = find(name=args[0], timeout=10.0)
+            except (RuntimeError, BTLEException) as e:
+                logger.error('Problem with the Bluetooth adapter : {}'.format(
+                    e))
                 return False
-        else:
+        if device is not None:
+            mac_address = device.mac_address
+            addr_type = device.addr_type
+        elif is_mac_address(args[0]):
             addr_type = None
             mac_address = args[0]
+        else:
+            logger.error('Bad ID / MAC address / name : {}'.format(args[0]))
+            return False
         magic_blue = MagicBlue(mac_address,
                                version=bulb_version,
                                addr_type=addr_type)
-        magic_blue.connect(self.bluetooth_adapter)
+        if not magic_blue.connect(self.bluetooth_adapter, timeout=10.0,
+                                  retries=1):
+            logger.error('Could not connect to {}: {}'.format(
+                mac_address, magic_blue.connect_failure.value))
+            return False
         self._bulbs.append(magic_blue)
         logger.info('Connected')
 
     def cmd_disconnect(self, *args):
-        for bulb in self._bulbs:
-            bulb.disconnect()
-        self._bulbs = []
+        return lambda bulb: bulb.disconnect()
+
+    def cmd_bulbs(self, args):
+        print('{: <5} {: <16} {: <18}'.format('ID', 'Alias', 'Mac address'))
+        print('{: <5} {: <16} {: <18}'.format('--', '-----', '-----------'))
+        for i, bulb in enumerate(self._bulbs):
+            alias = self._label(bulb)
+            print('{: <5} {: <16} {: <18}'.format(
+                i + 1, alias if alias != bulb.mac_address else '',
+                bulb.mac_address))
+
+    def cmd_async(self, args):
+        if args[0] == 'on' and self._executor is None:
+            # A single worker keeps the commands in order
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        elif args[0] == 'off' and self._executor is not None:
+            executor, self._executor = self._executor, None
+            executor.shutdown(wait=True)
 
     def cmd_turn(self, args):
         if args[0] == 'on':
-            [bulb.turn_on() for bulb in self._bulbs]
+            return lambda bulb: bulb.turn_on()
         else:
-            [bulb.turn_off() for bulb in self._bulbs]
+            return lambda bulb: bulb.turn_off()
 
     def cmd_debug(self, args):
         logging.basicConfig(level=logging.DEBUG)
@@ -194,41 +371,37 @@ class MagicBlueShell:
             lib_logger.setLevel(logging.OFF)
 
     def cmd_read(self, args):
-        for bulb in self._bulbs:
-            logger.info('-------------------')
-            if args[0] == 'name':
-                name = bulb.get_device_name()
-                logger.info('Received name: {}'.format(name))
-            elif args[0] == 'device_info':
-                device_info = bulb.get_device_info()
-                logger.info('Received device_info: {}'.format(device_info))
-            elif args[0] == 'date_time':
-                datetime_ = bulb.get_date_time()
-                logger.info('Received datetime: {}'.format(datetime_))
-            elif args[0] == 'time_schedule':
-                timer_schedule = bulb.get_time_schedule()
-
-                logger.info('Time schedule:')
-                for timer in timer_schedule:
-                    logger.info('Timer: {}'.format(pformat(timer)))
+        if args[0] == 'name':
+            return lambda bulb: bulb.get_device_name()
+        elif args[0] == 'device_info':
+            return lambda bulb: bulb.get_device_info(READ_TIMEOUT)
+        elif args[0] == 'date_time':
+            return lambda bulb: bulb.get_date_time(READ_TIMEOUT)
+        elif args[0] == 'time_schedule':
+            return lambda bulb: bulb.get_time_schedule(READ_TIMEOUT)
+        self.print_usage('read')
 
     def cmd_set_color(self, args):
-        color = args[0]
         try:
-            if color.startswith('#'):
-                [b.set_color(hex_to_rgb(color)) for b in self._bulbs]
-            else:
-                [b.set_color(name_to_rgb(color)) for b in self._bulbs]
+            kind, value = parse_light(args[0])
         except ValueError as e:
             logger.error('Invalid color value : {}'.format(str(e)))
             self.print_usage('set_color')
+            return
+
+        if kind == 'warm_light':
+            return lambda bulb: bulb.set_warm_light(value)
+        else:
+            return lambda bulb: bulb.set_color(value)
 
     def cmd_set_warm_light(self, *args):
         try:
-            [bulb.set_warm_light(float(args[0][0])) for bulb in self._bulbs]
+            intensity = float(args[0][0])
         except ValueError as e:
             logger.error('Invalid intensity value : {}'.format(str(e)))
             self.print_usage('set_color')
+        else:
+            return lambda bulb: bulb.set_warm_light(intensity)
 
     def cmd_set_effect(self, *args):
         try:
@@ -240,12 +413,10 @@ class MagicBlueShell:
         except ValueError:
             self.print_usage('set_effect')
         else:
-            [bulb.set_effect(effect, speed) for bulb in self._bulbs]
+            return lambda bulb: bulb.set_effect(effect, speed)
 
     def cmd_set_date_time(self, *args):
-        now = datetime.now()
-        for bulb in self._bulbs:
-            bulb.set_date_time(now)
+        return lambda bulb: bulb.set_date_time()
 
     def list_commands(self, *args):
         print(' ----------------------------')
@@ -258,8 +429,12 @@ class MagicBlueShell:
                     command.cmd_str, ' '.join(command.params), command.help))
             for alias in command.aliases:
                 print('{: <16}{: <48}{}'.format(alias, '//', '//'))
+        print('Prefix a command with @ID, @mac, @alias or @group (comma '
+              'separated) to target some bulbs, chain commands with ";"')
 
     def cmd_exit(self, *args):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
         print('Bye !')
 
     def _check_args(self, cmd, args):
@@ -277,21 +452,6 @@ class MagicBlueShell:
                      ), None)
 
 
-class ScanDelegate(DefaultDelegate):
-    def __init__(self):
-        DefaultDelegate.__init__(self)
-        self.devices = []
-
-    def handleDiscovery(self, dev, is_new_device, is_new_data):
-        if is_new_device:
-            self.devices.append(dev)
-            raw_name = dev.getValueText(9)
-            dev_name = raw_name.split('\x00')[0] if raw_name else "NO_NAME"
-            print('{: <5} {: <30} {: <12}'.format(len(self.devices),
-                                                  dev_name,
-                                                  dev.addr))
-
-
 def get_params():
     parser = argparse.ArgumentParser(description='Python tool to control Magic'
                                                  'Blue bulbs over Bluetooth')
@@ -310,6 +470,10 @@ def get_params():
                         default='hci0',
                         dest='bluetooth_adapter',
                         help='Bluetooth adapter name as listed by hciconfig')
+    parser.add_argument('-f', '--fleet',
+                        dest='fleet',
+                        help='Fleet config file (.json, .toml or .yaml) '
+                             'listing the bulbs to connect on start')
     parser.add_argument('-b', '--bulb-version',
                         default='7',
                         dest='bulb_version',
@@ -331,11 +495,15 @@ def main():
         shell.list_commands()
     elif params.command:
         logging.basicConfig(level=logging.WARNING)
+        if params.fleet:
+            shell.load_fleet(params.fleet)
         if params.mac_address:
             shell.cmd_connect([params.mac_address])
         shell.exec_cmd(params.command)
     else:
         logging.basicConfig(level=logging.INFO)
+        if params.fleet:
+            shell.load_fleet(params.fleet)
         shell.start_interactive_mode()
     return 0
 
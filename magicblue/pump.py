@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : pump.py
+# description     : Background delivery of Magic Blue bulbs notifications
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+import logging
+import select
+import threading
+from collections import namedtuple
+from time import monotonic
+
+
+__all__ = ['Notification', 'NotificationPump']
+
+
+logger = logging.getLogger(__name__)
+
+
+#: A decoded frame sent by a bulb. kind is 'device_info', 'date_time' or
+#: 'time_schedule', timestamp is a time.monotonic() value
+Notification = namedtuple('Notification', ['bulb', 'kind', 'value',
+                                           'timestamp'])
+
+
+def _fileno(connection):
+    """File descriptor becoming readable when the connection has data"""
+    fileno = getattr(connection, 'fileno', None)
+    if fileno is not None:
+        return fileno()
+    helper = getattr(connection, '_helper', None)
+    if helper is None:
+        return None
+    return helper.stdout.fileno()
+
+
+class NotificationPump(threading.Thread):
+    """
+    Background thread delivering the notifications of one or many bulbs as
+    soon as they arrive. It waits on all bluepy-helper pipes at once with
+    select, then lets each bulb decode its frames while holding its
+    connection lock, so it can run alongside writes from other threads.
+
+    Decoded frames are put on queue and/or given to callback as
+    :class:`Notification`. While a bulb is pumped, its get_* methods wait
+    for the pump to deliver the reply instead of reading the connection.
+    """
+
+    def __init__(self, bulbs=(), queue=None, callback=None,
+                 poll_interval=0.5):
+        """
+        :param bulbs: connected :class:`.MagicBlue` to start with
+        :param queue: a queue.Queue receiving :class:`Notification`
+        :param callback: function called with each :class:`Notification`
+        :param poll_interval: how often connections without a pipe to
+            select on are polled, in seconds
+        """
+        super().__init__(name='magicblue-notification-pump', daemon=True)
+        self.queue = queue
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self._bulbs = []
+        self._bulbs_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        for bulb in bulbs:
+            self.add(bulb)
+
+    def add(self, bulb):
+        """
+        Start delivering notifications of bulb
+        """
+        with self._bulbs_lock:
+            if bulb in self._bulbs:
+                return
+            self._bulbs.append(bulb)
+        with bulb._lock:
+            bulb._pumped = True
+            bulb._notification_listeners.append(self._deliver)
+
+    def remove(self, bulb):
+        """
+        Stop delivering notifications of bulb
+        """
+        with self._bulbs_lock:
+            if bulb not in self._bulbs:
+                return
+            self._bulbs.remove(bulb)
+        with bulb._lock:
+            bulb._pumped = False
+            bulb._notification_listeners.remove(self._deliver)
+
+    def stop(self, timeout=None):
+        """
+        Stop the pump and wait for its thread to end
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        for bulb in list(self._bulbs):
+            self.remove(bulb)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with self._bulbs_lock:
+                bulbs = list(self._bulbs)
+            selectable = {}
+            polled = []
+            for bulb in bulbs:
+                connection = bulb._connection
+                if connection is None:
+                    continue
+                fileno = _fileno(connection)
+                if fileno is None:
+                    polled.append(bulb)
+                else:
+                    selectable[fileno] = bulb
+
+            if not selectable and not polled:
+                self._stop_event.wait(self.poll_interval)
+                continue
+
+            try:
+                readable, _, _ = select.select(list(selectable), [], [],
+                                               self.poll_interval)
+            except (OSError, ValueError):
+                # A connection got closed while selecting on it
+                continue
+
+            for bulb in [selectable[fd] for fd in readable] + polled:
+                self._process(bulb)
+
+    def _process(self, bulb):
+        try:
+            bulb.process_notifications()
+        except Exception as e:
+            logger.warning('Connection to {} lost: {}'.format(bulb, e))
+            self.remove(bulb)
+
+    def _deliver(self, bulb, kind, value):
+        notification = Notification(bulb, kind, value, monotonic())
+        if self.queue is not None:
+            self.queue.put(notification)
+        if self.callback is not None:
+            try:
+                self.callback(notification)
+            except Exception:
+                logger.exception('Error in notification callback')
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : replay.py
+# description     : Record and replay the BLE traffic of Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+"""
+Record the traffic between :class:`.MagicBlue` and real bulbs to a JSONL
+log, then play it back offline::
+
+    with TrafficLog('session.jsonl') as log:
+        bulb = MagicBlue(mac, peripheral_factory=recording_factory(log))
+        ...
+
+    bulb = MagicBlue(mac, peripheral_factory=replay_factory('session.jsonl'))
+
+Each line of the log is a JSON object with t (seconds since the start of
+the recording), mac, op (connect, char, write, read, ntfy or disconnect)
+and, depending on op, u (characteristic UUID), h (handle), d (hex data),
+r (write with response) and lat (connection latency).
+"""
+import binascii
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from bluepy import btle
+
+
+__all__ = ['TrafficLog', 'RecordingPeripheral', 'ReplayPeripheral',
+           'ReplayMismatch', 'recording_factory', 'replay_factory',
+           'read_log']
+
+
+logger = logging.getLogger(__name__)
+
+
+def _hex(data):
+    return binascii.b2a_hex(bytes(data)).decode('ascii')
+
+
+def read_log(path):
+    """
+    :return: list of the records of a log written by :class:`TrafficLog`
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayMismatch(Exception):
+    """
+    The library sent something else than what was recorded
+    """
+
+
+class TrafficLog:
+    """
+    Thread-safe JSONL writer shared by the recording peripherals
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'w')
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+
+    def record(self, mac_address, op, **fields):
+        fields['t'] = round(time.monotonic() - self._start, 6)
+        fields['mac'] = mac_address
+        fields['op'] = op
+        line = json.dumps(fields, separators=(',', ':'), sort_keys=True)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _RecordingCharacteristic:
+    def __init__(self, peripheral, characteristic):
+        self._peripheral = peripheral
+        self._characteristic = characteristic
+
+    def write(self, val, withResponse=False):
+        self._peripheral._record('write', u=str(self._characteristic.uuid),
+                                 d=_hex(val), r=bool(withResponse))
+        return self._characteristic.write(val, withResponse)
+
+    def read(self):
+        val = self._characteristic.read()
+        self._peripheral._record('read', u=str(self._characteristic.uuid),
+                                 d=_hex(val))
+        return val
+
+    def __getattr__(self, name):
+        return getattr(self._characteristic, name)
+
+
+class RecordingPeripheral:
+    """
+    Wraps a connected bluepy Peripheral and logs everything written to and
+    received from it
+    """
+
+    def __init__(self, peripheral, log, mac_address):
+        """
+        :param peripheral: a connected btle.Peripheral
+        :param log: the :class:`TrafficLog` to write to
+        :param mac_address: MAC address used to tag the records
+        """
+        self._peripheral = peripheral
+        self._log = log
+        self._mac_address = mac_address
+        self.delegate = None
+
+    def _record(self, op, **fields):
+        self._log.record(self._mac_address, op, **fields)
+
+    def withDelegate(self, delegate):
+        self.delegate = delegate
+        self._peripheral.withDelegate(self)
+        return self
+
+    def handleNotification(self, handle, data):
+        self._record('ntfy', h=handle, d=_hex(data))
+        if self.delegate is not None:
+            self.delegate.handleNotification(handle, data)
+
+    def getCharacteristics(self, *args, **kwargs):
+        characteristics = self._peripheral.getCharacteristics(*args, **kwargs)
+        for characteristic in characteristics:
+            self._record('char', u=str(characteristic.uuid),
+                         h=characteristic.valHandle)
+        return [_RecordingCharacteristic(self, characteristic)
+                for characteristic in characteristics]
+
+    def writeCharacteristic(self, handle, val, withResponse=False):
+        self._record('write', h=handle, d=_hex(val), r=bool(withResponse))
+        return self._peripheral.writeCharacteristic(handle, val, withResponse)
+
+    def waitForNotifications(self, timeout):
+        return self._peripheral.waitForNotifications(timeout)
+
+    def disconnect(self):
+        self._record('disconnect')
+        return self._peripheral.disconnect()
+
+    def fileno(self):
+        helper = getattr(self._peripheral, '_helper', None)
+        return helper.stdout.fileno() if helper is not None else None
+
+    def __getattr__(self, name):
+        return getattr(self._peripheral, name)
+
+
+def recording_factory(log, peripheral_factory=btle.Peripheral):
+    """
+    Peripheral factory for :class:`.MagicBlue` recording the traffic
+
+    :param log: the :class:`TrafficLog` to write to
+    :param peripheral_factory: factory creating the real connection
+    """
+    def connect(mac_address, addr_type, adapter):
+        start = time.monotonic()
+        peripheral = peripheral_factory(mac_address, addr_type, adapter)
+        log.record(mac_address, 'connect', a=addr_type,
+                   lat=round(time.monotonic() - start, 6))
+        return RecordingPeripheral(peripheral, log, mac_address)
+
+    return connect
+
+
+class _ReplayCharacteristic:
+    def __init__(self, peripheral, uuid, handle):
+        self._peripheral = peripheral
+        self.uuid = uuid
+        self.valHandle = handle
+
+    def write(self, val, withResponse=False):
+        self._peripheral._replay_write(val)
+
+    def read(self):
+        return self._peripheral._replay_read(str(self.uuid))
+
+
+class ReplayPeripheral:
+    """
+    Plays back the recorded traffic of a bulb. Each write is matched with
+    the next recorded write, then the notifications that followed it are
+    delivered with the recorded delays divided by speed.
+    """
+
+    def __init__(self, mac_address, records, speed=1.0, strict=False,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        :param mac_address: bulb to replay
+        :param records: records of the log, see :func:`read_log`
+        :param speed: playback speed, float('inf') to play as fast as
+            possible
+        :param strict: raise :class:`ReplayMismatch` when a write differs
+            from the recording, instead of logging a warning
+        """
+        self._records = [r for r in records if r['mac'] == mac_address]
+        if not self._records:
+            raise btle.BTLEException(btle.BTLEException.DISCONNECTED,
+                                     '{} is not in the recording'
+                                     .format(mac_address))
+        self._mac_address = mac_address
+        self._speed = speed
+        self._strict = strict
+        self._clock = clock
+        self._sleep = sleep
+        self._handles = {r['u']: r['h'] for r in self._records
+                         if r['op'] == 'char'}
+        self._due = deque()
+        self._cursor = 0
+        self.delegate = None
+        self._schedule(self._records[0]['t'])
+
+    def _delay(self, seconds):
+        return seconds / self._speed if self._speed else 0
+
+    def _schedule(self, anchor):
+        """Queue the notifications following the cursor"""
+        now = self._clock()
+        while self._cursor < len(self._records):
+            record = self._records[self._cursor]
+            if record['op'] in ('write', 'read', 'disconnect'):
+                break
+            if record['op'] == 'ntfy':
+                self._due.append((now + self._delay(record['t'] - anchor),
+                                  record['h'],
+                                  binascii.a2b_hex(record['d'])))
+            self._cursor += 1
+
+    def _next(self, op):
+        while self._cursor < len(self._records):
+            record = self._records[self._cursor]
+            self._cursor += 1
+            if record['op'] == op:
+                return record
+        return None
+
+    def _replay_write(self, val):
+        record = self._next('write')
+        if record is None or record['d'] != _hex(val):
+            msg = '{}: wrote {}, recording has {}'.format(
+                self._mac_address, _hex(val), record and record['d'])
+            if self._strict:
+                raise ReplayMismatch(msg)
+            logger.warning(msg)
+        if record is not None:
+            self._schedule(record['t'])
+
+    def _replay_read(self, uuid):
+        record = self._next('read')
+        if record is None:
+            raise ReplayMismatch('{}: no more reads recorded'
+                                 .format(self._mac_address))
+        self._schedule(record['t'])
+        return binascii.a2b_hex(record['d'])
+
+    def withDelegate(self, delegate):
+        self.delegate = delegate
+        return self
+
+    def getCharacteristics(self, startHnd=1, endHnd=0xFFFF, uuid=None):
+        if uuid is None:
+            return []
+        uuid = btle.UUID(uuid)
+        return [_ReplayCharacteristic(self, uuid,
+                                      self._handles.get(str(uuid), 0))]
+
+    def writeCharacteristic(self, handle, val, withResponse=False):
+        self._replay_write(val)
+
+    def waitForNotifications(self, timeout):
+        if not self._due:
+            self._sleep(self._delay(timeout))
+            return False
+
+        due, handle, data = self._due[0]
+        wait = due - self._clock()
+        if wait > timeout:
+            self._sleep(timeout)
+            return False
+        if wait > 0:
+            self._sleep(wait)
+        self._due.popleft()
+        if self.delegate is not None:
+            self.delegate.handleNotification(handle, data)
+        return True
+
+    def disconnect(self):
+        self._due.clear()
+
+
+def replay_factory(path, speed=1.0, strict=False):
+    """
+    Peripheral factory for :class:`.MagicBlue` replaying a recording
+
+    :param path: log written by :class:`TrafficLog`
+    :param speed: playback speed, float('inf') to play as fast as possible
+    :param strict: raise :class:`ReplayMismatch` on unexpected writes
+    """
+    records = read_log(path)
+
+    def connect(mac_address, addr_type, adapter):
+        return ReplayPeripheral(mac_address, records, speed, strict)
+
+    return connect
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : scan.py
+# description     : Discover Bluetooth LE devices and Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+"""
+Devices are yielded while the scan runs, so a script can stop as soon as it
+found what it needs::
+
+    device = find(name='LEDBLE-1F2E3D4C', timeout=10)
+    if device is not None:
+        bulb = MagicBlue(device.mac_address, addr_type=device.addr_type)
+
+    for device in scan(timeout=30, magic_blue_only=True):
+        print(device.mac_address, device.name, device.rssi)
+
+Advertisements and scan responses come separately, so a device can be
+yielded a first time without its name, then again once its name is known.
+"""
+import logging
+import re
+from collections import namedtuple, OrderedDict
+from time import monotonic
+
+from bluepy.btle import Scanner, DefaultDelegate
+
+
+__all__ = ['scan', 'find', 'DiscoveredDevice', 'DeviceIndex',
+           'is_mac_address']
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Name prefix advertised by Magic Blue bulbs
+MAGIC_BLUE_NAME_PREFIX = 'LEDBLE'
+#: 16 bits services of the bulbs, as found in advertisements
+MAGIC_BLUE_SERVICES = {'ffe0', 'ffe5'}
+
+_AD_SHORT_NAME = 8
+_AD_COMPLETE_NAME = 9
+_AD_SERVICES_16 = (2, 3)
+
+_MAC_ADDRESS = re.compile(r'^([0-9a-f]{2}:){5}[0-9a-f]{2}$', re.IGNORECASE)
+
+
+#: A device seen during a scan. rssi is the signal strength in dBm,
+#: is_magic_blue tells if it looks like a Magic Blue bulb from its name or
+#: advertised services
+DiscoveredDevice = namedtuple('DiscoveredDevice', ['mac_address', 'addr_type',
+                                                   'name', 'rssi',
+                                                   'is_magic_blue'])
+
+
+def is_mac_address(value):
+    """
+    :return: True if value is a MAC address as 'C7:17:1D:43:39:03'
+    """
+    return bool(_MAC_ADDRESS.match(value))
+
+
+def _services(entry):
+    services = set()
+    for tag in _AD_SERVICES_16:
+        value = entry.getValueText(tag) or ''
+        # Little endian 16 bits UUIDs
+        services.update(value[i + 2:i + 4] + value[i:i + 2]
+                        for i in range(0, len(value) - 3, 4))
+    return services
+
+
+def _device(entry):
+    """:return: the :class:`DiscoveredDevice` of a bluepy ScanEntry"""
+    name = entry.getValueText(_AD_COMPLETE_NAME) or \
+        entry.getValueText(_AD_SHORT_NAME)
+    if name:
+        name = name.split('\x00')[0] or None
+    is_magic_blue = bool(name and name.startswith(MAGIC_BLUE_NAME_PREFIX)) \
+        or bool(_services(entry) & MAGIC_BLUE_SERVICES)
+    return DiscoveredDevice(entry.addr, entry.addrType, name, entry.rssi,
+                            is_magic_blue)
+
+
+class _Collector(DefaultDelegate):
+    """Keeps the devices discovered since the last time they were taken"""
+
+    def __init__(self):
+        DefaultDelegate.__init__(self)
+        self.pending = OrderedDict()
+
+    def handleDiscovery(self, entry, is_new_device, is_new_data):
+        if is_new_device or is_new_data:
+            self.pending[entry.addr] = _device(entry)
+
+    def take(self):
+        devices = list(self.pending.values())
+        self.pending.clear()
+        return devices
+
+
+def scan(timeout=10.0, adapter=0, magic_blue_only=False, passive=False,
+         scanner_factory=Scanner):
+    """
+    Scan for Bluetooth LE devices, yielding them as they are discovered.
+    The scan stops when the generator is closed (break out of the loop) or
+    after timeout seconds.
+
+    :param timeout: maximum duration of the scan in seconds, None to scan
+        until the generator is closed
+    :param adapter: bluetooth adapter number, 0 for hci0
+    :param magic_blue_only: only yield devices that look like Magic Blue
+        bulbs
+    :param passive: passive scan (no scan request, so names may be missing)
+    :param scanner_factory: function(adapter) returning a bluepy Scanner
+    :return: generator of :class:`DiscoveredDevice`. A device is yielded
+        again when its advertised data changes, as its name arriving
+    """
+    collector = _Collector()
+    scanner = scanner_factory(adapter).withDelegate(collector)
+    end = None if timeout is None else monotonic() + timeout
+    scanner.start(passive=passive)
+    try:
+        while True:
+            remaining = 1.0 if end is None else min(1.0, end - monotonic())
+            if remaining <= 0:
+                break
+            # Short slices so devices are yielded while scanning
+            scanner.process(min(remaining, 0.2))
+            for device in collector.take():
+                if device.is_magic_blue or not magic_blue_only:
+                    yield device
+    finally:
+        scanner.stop()
+
+
+def find(mac_address=None, name=None, predicate=None, timeout=10.0,
+         adapter=0, magic_blue_only=False, scanner_factory=Scanner):
+    """
+    Scan until a device matches, then stop the scan right away
+
+    :param mac_address: MAC address of the device, case insensitive
+    :param name: name of the device, case insensitive
+    :param predicate: function(device) returning True for the device
+        wanted
+    :return: the first matching :class:`DiscoveredDevice`, None if none
+        was found within timeout seconds
+    """
+    for device in scan(timeout, adapter, magic_blue_only,
+                       scanner_factory=scanner_factory):
+        if mac_address is not None and \
+                device.mac_address.lower() != mac_address.lower():
+            continue
+        if name is not None and \
+                (device.name or '').lower() != name.lower():
+            continue
+        if predicate is not None and not predicate(device):
+            continue
+        return device
+    return None
+
+
+class DeviceIndex:
+    """
+    Devices of a scan, by order of discovery (ID 1 is the first one), by
+    MAC address and by name
+    """
+
+    def __init__(self, devices=()):
+        self._devices = []
+        self._by_mac = {}
+        for device in devices:
+            self.add(device)
+
+    def add(self, device):
+        """
+        Add or update a device
+
+        :return: its ID, and True if it's new
+        """
+        mac = device.mac_address.lower()
+        if mac in self._by_mac:
+            index = self._by_mac[mac]
+            self._devices[index] = device
+            return index + 1, False
+        self._by_mac[mac] = len(self._devices)
+        self._devices.append(device)
+        return len(self._devices), True
+
+    def __getitem__(self, dev_id):
+        """
+        :param dev_id: ID of the device, starting at 1
+        """
+        if not 1 <= dev_id <= len(self._devices):
+            raise IndexError('No device {}'.format(dev_id))
+        return self._devices[dev_id - 1]
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __iter__(self):
+        return iter(self._devices)
+
+    def by_mac(self, mac_address):
+        """
+        :return: the device with that MAC address, None if not seen
+        """
+        index = self._by_mac.get(mac_address.lower())
+        return None if index is None else self._devices[index]
+
+    def by_name(self, name):
+        """
+        :return: the devices with that name, case insensitive
+        """
+        return [device for device in self._devices
+                if (device.name or '').lower() == name.lower()]
+
+    def lookup(self, key):
+        """
+        Find a device from an ID, a MAC address or a name
+
+        :return: the device, None if not found or if several devices have
+            that name
+        """
+        if key.isdigit():
+            try:
+                return self[int(key)]
+            except IndexError:
+                return None
+        if is_mac_address(key):
+            return self.by_mac(key)
+        devices = self.by_name(key)
+        return devices[0] if len(devices) == 1 else None
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : schedule.py
+# description     : Provision time schedules on many Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+import logging
+from collections import namedtuple
+from enum import Enum
+
+try:
+    from magicblue.magicbluelib import Protocol
+    from magicblue.fleet import fan_out
+except ImportError:
+    from magicbluelib import Protocol
+    from fleet import fan_out
+
+
+__all__ = ['SyncStatus', 'ScheduleReport', 'normalize_schedule',
+           'provision_schedules']
+
+
+logger = logging.getLogger(__name__)
+
+
+class SyncStatus(Enum):
+    """
+    Outcome of the provisioning of a bulb
+    """
+    in_sync = 'in_sync'         #: Schedule already matched, nothing sent
+    updated = 'updated'         #: Schedule written (and verified if asked)
+    mismatch = 'mismatch'       #: Schedule written but read back differs
+    failed = 'failed'           #: Communication with the bulb failed
+
+
+#: Provisioning report of one bulb
+ScheduleReport = namedtuple('ScheduleReport', ['bulb', 'status', 'error',
+                                               'latency'])
+
+
+def normalize_schedule(timer_items):
+    """
+    Put timer items in the form returned by
+    :meth:`.MagicBlue.get_time_schedule`, so they can be compared with what
+    a bulb reports
+
+    :param timer_items: list of timer items, see
+        :meth:`.MagicBlue.set_time_schedule`
+    :return: list of 6 timer items
+    :raises ValueError: if there are more than 6 items or an item is
+        invalid
+    """
+    if len(timer_items) > 6:
+        raise ValueError('Maximum of 6 TimerItems allowed')
+    for timer_item in timer_items:
+        Protocol.validate_timer_item(timer_item)
+    msg = Protocol.encode_set_time_schedule(list(timer_items))
+    return Protocol.decode_time_schedule(msg)
+
+
+def provision_schedules(bulbs, timer_items, timeout=3.0, verify=True,
+                        max_parallel=None):
+    """
+    Push a time schedule to bulbs, skipping the ones already in sync. Bulbs
+    are handled in parallel.
+
+    :param bulbs: list of connected :class:`.MagicBlue`
+    :param timer_items: the schedule to push, see
+        :meth:`.MagicBlue.set_time_schedule`
+    :param timeout: how long to wait for each read-back, in seconds
+    :param verify: read the schedule back after writing it
+    :param max_parallel: maximum number of bulbs handled at the same time
+    :return: list of :class:`ScheduleReport`, in the same order as bulbs
+    :raises ValueError: if the schedule is invalid, before any bulb is
+        contacted
+    """
+    desired = normalize_schedule(timer_items)
+
+    def provision(bulb):
+        if bulb.get_time_schedule(timeout) == desired:
+            return SyncStatus.in_sync
+
+        bulb.set_time_schedule(timer_items)
+        if verify and bulb.get_time_schedule(timeout) != desired:
+            logger.warning('Schedule of {} differs after write'.format(bulb))
+            return SyncStatus.mismatch
+        return SyncStatus.updated
+
+    reports = []
+    for result in fan_out(bulbs, provision, max_parallel):
+        status = SyncStatus.failed if result.error is not None \
+            else result.value
+        reports.append(ScheduleReport(result.bulb, status, result.error,
+                                      result.latency))
+    return reports
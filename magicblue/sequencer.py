@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : sequencer.py
+# description     : Client-side playlists of effects and colors
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+"""
+Play a playlist on one or many bulbs::
+
+    playlist = [Step.color('red', 2), Step.effect(Effect.red_strobe_flash, 5,
+                10), Step.warm(0.5, 3), Step.off(1)]
+    Sequencer(bulbs, playlist, repeat=None).start()
+
+Steps are due at fixed times computed from the start, so the timing doesn't
+drift. Each bulb has its own thread and sends each step a bit early, by its
+measured write latency, so that a group changes at the same time.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+try:
+    from magicblue.colors import parse_color
+except ImportError:
+    from colors import parse_color
+
+
+__all__ = ['Step', 'Sequencer', 'PlayReport']
+
+
+logger = logging.getLogger(__name__)
+
+
+class Step(namedtuple('Step', ['action', 'value', 'duration'])):
+    """
+    An item of a playlist. action is 'effect' (value is (effect, speed)),
+    'color' (value is (r, g, b)), 'warm' (value is the intensity) or 'off'.
+    duration is in seconds.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def effect(cls, effect, speed, duration):
+        """
+        :param effect: an :class:`.Effect`
+        :param speed: effect speed, 1..20
+        """
+        if not 1 <= speed <= 20:
+            raise ValueError('Effect speed must be in 1..20')
+        return cls('effect', (effect, speed), duration)
+
+    @classmethod
+    def color(cls, color, duration):
+        """
+        :param color: anything :func:`.parse_color` accepts
+        """
+        return cls('color', parse_color(color), duration)
+
+    @classmethod
+    def warm(cls, intensity, duration):
+        """
+        :param intensity: warm light intensity between 0.0 and 1.0
+        """
+        return cls('warm', intensity, duration)
+
+    @classmethod
+    def off(cls, duration):
+        return cls('off', None, duration)
+
+    def apply(self, bulb, was_off=False):
+        """
+        Send the step to bulb, turning it on first if was_off
+        """
+        if self.action == 'off':
+            bulb.turn_off()
+            return
+        if was_off:
+            bulb.turn_on()
+        if self.action == 'effect':
+            bulb.set_effect(*self.value)
+        elif self.action == 'color':
+            bulb.set_color(self.value)
+        elif self.action == 'warm':
+            bulb.set_warm_light(self.value)
+        else:
+            raise ValueError('Unknown action: {}'.format(self.action))
+
+
+#: What a bulb played. lateness is the largest delay between the time a step
+#: was due and the end of its write, latency the last write latency estimate
+PlayReport = namedtuple('PlayReport', ['bulb', 'nb_sent', 'nb_skipped',
+                                       'lateness', 'latency', 'error'])
+
+
+class Sequencer:
+    """
+    Plays a playlist of :class:`Step` on bulbs, in sync
+    """
+
+    def __init__(self, bulbs, playlist, repeat=1, smoothing=0.2,
+                 clock=time.monotonic, sleep=None):
+        """
+        :param bulbs: list of connected :class:`.MagicBlue`
+        :param playlist: list of :class:`Step`
+        :param repeat: number of times the playlist is played, None to loop
+            until :meth:`stop`
+        :param smoothing: weight of the last measure in the write latency
+            estimate (exponentially weighted moving average)
+        :param clock: monotonic clock returning seconds
+        :param sleep: function used to wait until the next step, on the
+            same time base as clock. Default: a real-time wait that
+            :meth:`stop` interrupts
+        """
+        if not playlist:
+            raise ValueError('Empty playlist')
+        if any(step.duration <= 0 for step in playlist):
+            raise ValueError('Step durations must be positive')
+        self.bulbs = list(bulbs)
+        self.playlist = list(playlist)
+        self.repeat = repeat
+        self.smoothing = smoothing
+        self._clock = clock
+        self._sleep = sleep
+        self._stop = threading.Event()
+        self._thread = None
+        self.latency = {bulb: 0.0 for bulb in self.bulbs}
+        self.reports = []
+
+    @property
+    def period(self):
+        """Duration of the playlist in seconds"""
+        return sum(step.duration for step in self.playlist)
+
+    def timeline(self, start):
+        """
+        :return: generator of (due, step), due being a time of the clock
+        """
+        offset = 0.0
+        loop = 0
+        while self.repeat is None or loop < self.repeat:
+            for step in self.playlist:
+                yield start + offset, step
+                offset += step.duration
+            loop += 1
+
+    def run(self, start=None):
+        """
+        Play the playlist, blocking until it's done or stopped
+
+        :param start: clock time of the first step. Default: now. Give the
+            same start to several sequencers to keep them in sync
+        :return: list of :class:`PlayReport`, in the same order as the bulbs
+        """
+        self._stop.clear()
+        return self._run(start)
+
+    def _run(self, start):
+        start = self._clock() if start is None else start
+        threads = []
+        reports = {}
+        for bulb in self.bulbs:
+            thread = threading.Thread(
+                target=lambda bulb=bulb: reports.__setitem__(
+                    bulb, self._play(bulb, start)),
+                name='sequencer-{}'.format(bulb.mac_address), daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        self.reports = [reports[bulb] for bulb in self.bulbs]
+        return self.reports
+
+    def start(self, start=None):
+        """
+        Play the playlist in a background thread, see :meth:`run`
+        """
+        # Cleared here, not in the thread, so a stop() right after start()
+        # isn't lost
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(start,),
+                                        name='sequencer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop playing after the current step and wait for the threads
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _wait(self, delay):
+        """Wait delay seconds, return True if stopped"""
+        if self._sleep is None:
+            return self._stop.wait(delay)
+        if delay > 0:
+            self._sleep(delay)
+        return self._stop.is_set()
+
+    def _play(self, bulb, start):
+        nb_sent = nb_skipped = 0
+        lateness = 0.0
+        was_off = False
+        for due, step in self.timeline(start):
+            if self._stop.is_set():
+                break
+            # A bulb that fell a whole step behind skips it to catch up
+            if self._clock() >= due + step.duration:
+                nb_skipped += 1
+                continue
+            if self._wait(max(0.0, due - self.latency[bulb] -
+                              self._clock())):
+                break
+
+            sent_at = self._clock()
+            try:
+                step.apply(bulb, was_off)
+            except Exception as e:
+                logger.error('Sequencer stopped on {}: {}'.format(bulb, e))
+                return PlayReport(bulb, nb_sent, nb_skipped, lateness,
+                                  self.latency[bulb], e)
+            done_at = self._clock()
+
+            was_off = step.action == 'off'
+            nb_sent += 1
+            lateness = max(lateness, done_at - due)
+            self.latency[bulb] += self.smoothing * (
+                done_at - sent_at - self.latency[bulb])
+        return PlayReport(bulb, nb_sent, nb_skipped, lateness,
+                          self.latency[bulb], None)
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : shard.py
+# description     : Drive a large fleet of Magic Blue bulbs from many processes
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+"""
+Split a fleet across worker processes, one per bluetooth adapter by
+default, each driving its bulbs with its own :class:`.Fleet`::
+
+    with ShardedFleet.from_config(FleetConfig.load('fleet.yaml')) as fleet:
+        fleet.connect_all()
+        fleet.set_color('red')
+        print(fleet.metrics())
+
+The coordinator sends commands to every worker through a pipe and waits for
+all of them, so commands run on all the shards at the same time. Results
+come back as :class:`ShardResult`, in the order of the bulbs.
+"""
+import logging
+import multiprocessing
+import os
+from collections import namedtuple
+from time import monotonic
+
+try:
+    from magicblue.magicbluelib import MagicBlue, Protocol
+    from magicblue.colors import parse_color
+    from magicblue.fleet import Fleet
+    from magicblue.health import HealthMonitor
+except ImportError:
+    from magicbluelib import MagicBlue, Protocol
+    from colors import parse_color
+    from fleet import Fleet
+    from health import HealthMonitor
+
+
+__all__ = ['ShardedFleet', 'ShardResult', 'ShardError']
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Outcome of a command on a bulb of a shard. error is the text of the
+#: exception, None if the command succeeded
+ShardResult = namedtuple('ShardResult', ['mac_address', 'value', 'error',
+                                         'latency'])
+
+
+class ShardError(Exception):
+    """
+    A worker process died or didn't answer in time
+    """
+
+
+def _results(results):
+    return [ShardResult(result.bulb.mac_address, result.value,
+                        None if result.error is None else str(result.error),
+                        result.latency)
+            for result in results]
+
+
+def _select(fleet, macs):
+    if macs is None:
+        return fleet.bulbs
+    macs = {mac.lower() for mac in macs}
+    return [bulb for bulb in fleet.bulbs if bulb.mac_address.lower() in macs]
+
+
+def _handle(fleet, command, kwargs):
+    """Run a command of the coordinator on the fleet of a worker"""
+    if command == 'connect':
+        return [ShardResult(report.bulb.mac_address, report.connected,
+                            None if report.error is None
+                            else str(report.error), report.latency)
+                for report in fleet.connect_all(**kwargs)]
+    if command == 'call':
+        method = kwargs['method']
+        args = kwargs.get('args', ())
+        return _results(fleet.fan_out(
+            lambda bulb: getattr(bulb, method)(*args),
+            timeout=kwargs.get('timeout'),
+            bulbs=_select(fleet, kwargs.get('macs'))))
+    if command == 'broadcast':
+        report = fleet.broadcast(kwargs['frame'],
+                                 _select(fleet, kwargs.get('macs')))
+        return _results(report.results)
+    if command == 'state':
+        return [ShardResult(bulb.mac_address, bulb.device_info, None, 0.0)
+                for bulb in fleet.bulbs]
+    if command == 'metrics':
+        return {
+            'pid': os.getpid(),
+            'bulbs': len(fleet),
+            'connected': sum(bulb.is_connected() for bulb in fleet),
+            'health': {bulb.mac_address: fleet.health[bulb].as_dict()
+                       for bulb in fleet},
+        }
+    if command == 'disconnect':
+        fleet.disconnect_all()
+        return None
+    raise ValueError('Unknown command: {}'.format(command))
+
+
+def _worker(conn, specs, peripheral_factory):
+    """Main loop of a worker process"""
+    fleet = Fleet(health=HealthMonitor())
+    for spec in specs:
+        fleet.add(MagicBlue(spec.mac_address, version=spec.version or 7,
+                            addr_type=spec.addr_type,
+                            peripheral_factory=peripheral_factory),
+                  alias=spec.alias, adapter=spec.adapter)
+    try:
+        while True:
+            try:
+                seq, command, kwargs = conn.recv()
+            except EOFError:
+                break
+            if command == 'stop':
+                break
+            try:
+                conn.send((seq, True, _handle(fleet, command, kwargs)))
+            except Exception as e:
+                logger.exception('Shard {} failed on {}'.format(
+                    os.getpid(), command))
+                conn.send((seq, False, str(e)))
+    finally:
+        fleet.disconnect_all()
+        conn.close()
+
+
+class ShardedFleet:
+    """
+    A fleet split across worker processes
+    """
+
+    def __init__(self, specs, default_adapter=0, max_bulbs_per_shard=None,
+                 peripheral_factory=None, start_method=None, timeout=60.0):
+        """
+        :param specs: list of :class:`.BulbConfig`
+        :param default_adapter: adapter of the bulbs not defining one
+        :param max_bulbs_per_shard: split the bulbs of an adapter across
+            several processes of at most this many bulbs. Default: one
+            process per adapter
+        :param peripheral_factory: passed to each :class:`.MagicBlue`. Must
+            be picklable (a module-level function)
+        :param start_method: multiprocessing start method ('fork', 'spawn'
+            or 'forkserver'). Default: the platform's
+        :param timeout: seconds to wait for the workers to answer a command
+        """
+        self.specs = [spec if spec.adapter is not None
+                      else spec._replace(adapter=default_adapter)
+                      for spec in specs]
+        self.shards = self._split(self.specs, max_bulbs_per_shard)
+        self.timeout = timeout
+        self._peripheral_factory = peripheral_factory
+        self._context = multiprocessing.get_context(start_method)
+        self._workers = []
+        # Commands are numbered so answers arriving after their command
+        # timed out are told apart from the answer to the current one
+        self._seq = 0
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """
+        :param config: a :class:`.FleetConfig`
+        """
+        return cls(config.bulbs, default_adapter=config.adapter, **kwargs)
+
+    @staticmethod
+    def _split(specs, max_bulbs_per_shard):
+        by_adapter = {}
+        for spec in specs:
+            by_adapter.setdefault(spec.adapter, []).append(spec)
+        shards = []
+        for adapter_specs in by_adapter.values():
+            size = max_bulbs_per_shard or len(adapter_specs)
+            shards.extend(adapter_specs[i:i + size]
+                          for i in range(0, len(adapter_specs), size))
+        return shards
+
+    def start(self):
+        """
+        Start the worker processes
+        """
+        for specs in self.shards:
+            conn, worker_conn = self._context.Pipe()
+            process = self._context.Process(
+                target=_worker, args=(worker_conn, specs,
+                                      self._peripheral_factory),
+                name='magicblue-shard', daemon=True)
+            process.start()
+            worker_conn.close()
+            self._workers.append((process, conn, specs))
+        logger.debug('Started {} shards'.format(len(self._workers)))
+
+    def stop(self, timeout=5.0):
+        """
+        Disconnect the bulbs and stop the worker processes
+        """
+        for process, conn, specs in self._workers:
+            try:
+                conn.send((None, 'stop', None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process, conn, specs in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self._workers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _command(self, command, **kwargs):
+        """
+        Send a command to all the workers, then collect their answers
+
+        :return: list of (specs, answer) with answer an exception if the
+            worker failed
+        """
+        if not self._workers:
+            raise ShardError('Shards not started')
+        self._seq += 1
+        dead = set()
+        for process, conn, specs in self._workers:
+            try:
+                conn.send((self._seq, command, kwargs))
+            except OSError:
+                dead.add(process)
+        deadline = monotonic() + self.timeout
+        answers = []
+        for process, conn, specs in self._workers:
+            try:
+                if process in dead:
+                    raise EOFError('not running')
+                answer = self._receive(process, conn, deadline)
+            except (EOFError, OSError) as e:
+                answer = ShardError('Shard {} died: {}'.format(process.pid, e))
+            except ShardError as e:
+                answer = e
+            answers.append((specs, answer))
+        return answers
+
+    def _receive(self, process, conn, deadline):
+        """
+        Wait for the answer of a worker to the current command, dropping the
+        late answers to previous commands
+        """
+        while True:
+            if not conn.poll(max(0.0, deadline - monotonic())):
+                raise ShardError('Shard {} timed out'.format(process.pid))
+            seq, success, answer = conn.recv()
+            if seq != self._seq:
+                logger.debug('Dropped a late answer of shard {}'.format(
+                    process.pid))
+                continue
+            return answer if success else ShardError(answer)
+
+    def _merge(self, answers):
+        """Flatten per-shard results, in the order of the specs"""
+        by_mac = {}
+        for specs, answer in answers:
+            if isinstance(answer, Exception):
+                for spec in specs:
+                    by_mac[spec.mac_address] = ShardResult(
+                        spec.mac_address, None, str(answer), 0.0)
+            else:
+                for result in answer:
+                    by_mac[result.mac_address] = result
+        return [by_mac[spec.mac_address] for spec in self.specs
+                if spec.mac_address in by_mac]
+
+    def connect_all(self, max_parallel=4, retries=2, timeout=10.0):
+        """
+        Connect the bulbs of every shard, see :meth:`.Fleet.connect_all`
+
+        :return: list of :class:`ShardResult` whose value is True if the
+            bulb is connected
+        """
+        return self._merge(self._command('connect', max_parallel=max_parallel,
+                                         retries=retries, timeout=timeout))
+
+    def call(self, method, *args, macs=None, timeout=None):
+        """
+        Call a :class:`.MagicBlue` method on the bulbs of every shard
+
+        :param method: method name, as 'set_effect'
+        :param macs: MAC addresses of the bulbs to call. Default: all
+        :param timeout: seconds each shard waits for its bulbs
+        :return: list of :class:`ShardResult`
+        """
+        return self._merge(self._command('call', method=method, args=args,
+                                         macs=macs, timeout=timeout))
+
+    def broadcast(self, frame, macs=None):
+        """
+        Write the same frame to the bulbs, see :func:`.broadcast`
+
+        :return: list of :class:`ShardResult`
+        """
+        return self._merge(self._command('broadcast', frame=bytes(frame),
+                                         macs=macs))
+
+    def set_color(self, rgb_color, macs=None):
+        return self.broadcast(Protocol.encode_set_rgb(*parse_color(rgb_color)),
+                              macs)
+
+    def turn_on(self, macs=None):
+        return self.broadcast(Protocol.encode_turn_on(), macs)
+
+    def turn_off(self, macs=None):
+        return self.broadcast(Protocol.encode_turn_off(), macs)
+
+    def disconnect_all(self):
+        self._command('disconnect')
+
+    def state(self):
+        """
+        :return: dict of MAC address => last :class:`.DeviceInfo` received
+            (None if none yet)
+        """
+        return {result.mac_address: result.value
+                for result in self._merge(self._command('state'))}
+
+    def metrics(self):
+        """
+        :return: dict with the number of shards, bulbs and connected bulbs,
+            the per-shard figures and the health of each bulb
+        """
+        shards = []
+        health = {}
+        for specs, answer in self._command('metrics'):
+            if isinstance(answer, Exception):
+                shards.append({'error': str(answer), 'bulbs': len(specs)})
+                continue
+            health.update(answer.pop('health'))
+            shards.append(answer)
+        return {
+            'shards': shards,
+            'bulbs': len(self.specs),
+            'connected': sum(shard.get('connected', 0) for shard in shards),
+            'health': health,
+        }
+
+    def __len__(self):
+        return len(self.specs)
@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : simulator.py
+# description     : Discrete-event simulation of fleets of Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# usage           : python -m magicblue.simulator --bulbs 10 50 --adapters 1 2
+# python_version  : 3.4
+# =============================================================================
+"""
+Load-test the library against simulated bulbs, on a virtual clock::
+
+    network = SimNetwork(nb_adapters=2)
+    bulbs = [network.create_bulb(mac) for mac in network.macs(20)]
+    result = run_scenes(network, bulbs, scene_rate=10, duration=5)
+
+The real :class:`.MagicBlue` and :class:`.Protocol` code runs unchanged:
+only the peripheral is simulated. Simulated bulbs decode the frames they
+receive and answer requests with device info, date/time and time schedule
+notifications in the format the bulbs use.
+
+Radio model: each adapter accepts max_connections links. Each link has
+connection events every interval seconds, with a random phase. A write
+goes out at the first connection event of its link after the radio of the
+adapter is free, and then occupies the radio for write_time seconds. The
+caller pays host_overhead seconds per write (bluepy-helper round trip).
+Blocking waits (replies, timeouts) advance the virtual clock instead of
+sleeping, so a simulation runs much faster than real time. Bulbs must use
+the clock of the network for their timeouts, as those made by
+:meth:`SimNetwork.create_bulb` do, and be polled without a notification
+pump.
+"""
+import argparse
+import heapq
+import logging
+import math
+import random
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from bluepy import btle
+
+try:
+    from magicblue.magicbluelib import MagicBlue, UUID_CHARACTERISTIC_RECV
+except ImportError:
+    from magicbluelib import MagicBlue, UUID_CHARACTERISTIC_RECV
+
+
+__all__ = ['SimClock', 'SimAdapter', 'SimBulb', 'SimPeripheral',
+           'SimNetwork', 'SweepResult', 'run_scenes', 'sweep']
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Outcome of a simulated run. Latencies are in seconds, from the time a
+#: scene was due to the time its last write went out. throughput is in
+#: writes per second
+SweepResult = namedtuple('SweepResult', [
+    'nb_adapters', 'nb_bulbs', 'nb_connected', 'nb_scenes', 'late_scenes',
+    'throughput', 'p50', 'p95', 'p99', 'max'])
+
+
+class SimClock:
+    """
+    Virtual clock. Only moves forward
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def advance_to(self, t):
+        self.now = max(self.now, t)
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def __call__(self):
+        return self.now
+
+
+class SimAdapter:
+    """
+    A bluetooth adapter: a shared radio and a limited number of links
+    """
+
+    def __init__(self, index, max_connections=7, interval=0.0075,
+                 write_time=0.0025):
+        self.index = index
+        self.max_connections = max_connections
+        self.interval = interval
+        self.write_time = write_time
+        self.nb_links = 0
+        self.busy_until = 0.0
+
+    def transmit(self, link, t):
+        """
+        :param link: the :class:`SimPeripheral` sending
+        :param t: time the packet is ready
+        :return: time the packet is sent
+        """
+        start = max(t, self.busy_until, link.next_free)
+        events = math.ceil((start - link.phase) / self.interval)
+        start = link.phase + max(events, 0) * self.interval
+        done = start + self.write_time
+        self.busy_until = link.next_free = done
+        return done
+
+
+class SimBulb:
+    """
+    State and protocol of a simulated bulb
+    """
+
+    def __init__(self, mac_address, clock, version=6):
+        self.mac_address = mac_address
+        self._clock = clock
+        self.version = version
+        self.on = True
+        self.rgb = (255, 255, 255)
+        self.effect_no = 0x41
+        self.effect_speed = 1
+        self.brightness = 0
+        self._date_time = datetime(2000, 1, 1)
+        self._date_time_at = 0.0
+        self.schedule = bytearray([0x25]) + \
+            bytearray([0x0F] + [0] * 13) * 6 + bytearray([0x00, 0x52])
+        self._schedule_buffer = None
+        self.nb_frames = 0
+
+    def handle(self, frame):
+        """
+        Apply a frame written to the bulb
+
+        :return: list of notifications to send back
+        """
+        self.nb_frames += 1
+        if self._schedule_buffer is not None:
+            self._schedule_buffer += frame
+            if len(self._schedule_buffer) >= 87:
+                self.schedule = bytearray([0x25]) + \
+                    self._schedule_buffer[1:85] + bytearray([0x00, 0x52])
+                self._schedule_buffer = None
+            return []
+
+        kind = frame[0]
+        if kind == 0x56 and len(frame) >= 7:
+            if frame[5] == 0xF0:
+                self.rgb, self.brightness = tuple(frame[1:4]), 0
+            else:
+                self.rgb, self.brightness = (0, 0, 0), frame[4]
+            self.effect_no = 0x41
+        elif kind == 0xCC and len(frame) >= 3:
+            self.on = frame[1] == 0x23
+        elif kind == 0xBB and len(frame) >= 4:
+            self.effect_no, self.effect_speed = frame[1], frame[2]
+        elif kind == 0x10 and len(frame) >= 8:
+            self._date_time = datetime(2000 + frame[2], frame[3], frame[4],
+                                       frame[5], frame[6], frame[7])
+            self._date_time_at = self._clock()
+        elif kind == 0x23:
+            self._schedule_buffer = bytearray(frame)
+        elif kind == 0xEF:
+            return [self.device_info_frame()]
+        elif kind == 0x12:
+            return [self.date_time_frame()]
+        elif kind == 0x24:
+            return [bytes(self.schedule[i:i + 20])
+                    for i in range(0, len(self.schedule), 20)]
+        return []
+
+    def device_info_frame(self):
+        return bytes([0x66, 0x04, 0x23 if self.on else 0x24, self.effect_no,
+                      0x20, self.effect_speed]) + bytes(self.rgb) + \
+            bytes([self.brightness, self.version, 0x99])
+
+    def date_time_frame(self):
+        now = self._date_time + timedelta(
+            seconds=self._clock() - self._date_time_at)
+        day_of_week = (now.isoweekday() + 1) % 7 or 7
+        return bytes([0x13, 0x14, now.year - 2000, now.month, now.day,
+                      now.hour, now.minute, now.second, day_of_week, 0x00,
+                      0x31])
+
+
+class _SimCharacteristic:
+    def __init__(self, peripheral, uuid, handle):
+        self._peripheral = peripheral
+        self.uuid = uuid
+        self.valHandle = handle
+
+    def write(self, val, withResponse=False):
+        self._peripheral.writeCharacteristic(self.valHandle, val,
+                                             withResponse)
+
+    def read(self):
+        self._peripheral._network.clock.advance(
+            2 * self._peripheral._adapter.interval)
+        return b'LEDBLE-' + self._peripheral.bulb.mac_address[-5:].replace(
+            ':', '').encode('ascii')
+
+
+class SimPeripheral:
+    """
+    A connection to a :class:`SimBulb`, usable as a bluepy Peripheral by
+    :class:`.MagicBlue`
+    """
+
+    def __init__(self, network, bulb, adapter):
+        self._network = network
+        self._adapter = adapter
+        self.bulb = bulb
+        self.phase = network.random.uniform(0, adapter.interval)
+        self.next_free = 0.0
+        self.last_done = 0.0
+        self.delegate = None
+        self._due = []
+        self._sequence = 0
+
+    def withDelegate(self, delegate):
+        self.delegate = delegate
+        return self
+
+    def getCharacteristics(self, startHnd=1, endHnd=0xFFFF, uuid=None):
+        uuid = btle.UUID(uuid)
+        handle = 0x0B if uuid == UUID_CHARACTERISTIC_RECV else 0x0E
+        return [_SimCharacteristic(self, uuid, handle)]
+
+    def writeCharacteristic(self, handle, val, withResponse=False):
+        clock = self._network.clock
+        clock.advance(self._network.host_overhead)
+        done = self._adapter.transmit(self, clock.now)
+        self.last_done = done
+        self._network.write_latencies.append(done - clock.now)
+        if withResponse:
+            clock.advance_to(done + self._adapter.interval)
+        if handle != 0x0E:
+            return  # Enabling notifications
+        for frame in self.bulb.handle(bytes(val)):
+            reply = self._adapter.transmit(self, done +
+                                           self._network.processing_time)
+            self._sequence += 1
+            heapq.heappush(self._due, (reply, self._sequence, frame))
+
+    def waitForNotifications(self, timeout):
+        clock = self._network.clock
+        if self._due and self._due[0][0] <= clock.now + timeout:
+            due, _, frame = heapq.heappop(self._due)
+            clock.advance_to(due)
+            if self.delegate is not None:
+                self.delegate.handleNotification(0x0E, frame)
+            return True
+        clock.advance(timeout)
+        return False
+
+    def disconnect(self):
+        if self._due is not None:
+            self._adapter.nb_links -= 1
+            self._due = None
+
+    def fileno(self):
+        return None
+
+
+class SimNetwork:
+    """
+    Simulated adapters and bulbs sharing a virtual clock
+    """
+
+    def __init__(self, nb_adapters=1, max_connections=7, interval=0.0075,
+                 write_time=0.0025, host_overhead=0.0003,
+                 processing_time=0.005, connect_time=0.3, seed=0):
+        """
+        :param nb_adapters: number of bluetooth adapters. Bulbs use the
+            adapter number given to connect(), modulo nb_adapters
+        :param max_connections: links per adapter
+        :param interval: connection interval of a link, in seconds
+        :param write_time: radio time of a write, in seconds
+        :param host_overhead: time the caller spends per write, in seconds
+        :param processing_time: time for a bulb to answer a request
+        :param connect_time: duration of a connection
+        :param seed: seed of the random connection event phases
+        """
+        self.clock = SimClock()
+        self.random = random.Random(seed)
+        self.adapters = [SimAdapter(i, max_connections, interval, write_time)
+                         for i in range(nb_adapters)]
+        self.host_overhead = host_overhead
+        self.processing_time = processing_time
+        self.connect_time = connect_time
+        self.bulbs = {}
+        self.write_latencies = []
+
+    @staticmethod
+    def macs(nb_bulbs):
+        """
+        :return: nb_bulbs MAC addresses to connect to
+        """
+        return ['C7:17:{:02X}:{:02X}:00:01'.format(i // 256, i % 256)
+                for i in range(nb_bulbs)]
+
+    def create_bulb(self, mac_address, version=9):
+        """
+        :return: a :class:`.MagicBlue` connecting to a simulated bulb, with
+            its timeouts measured on the virtual clock
+        """
+        return MagicBlue(mac_address, version=version,
+                         peripheral_factory=self.peripheral_factory,
+                         clock=self.clock)
+
+    def peripheral_factory(self, mac_address, addr_type, adapter):
+        """
+        Connect to a simulated bulb, see :class:`.MagicBlue`
+        """
+        if not isinstance(adapter, int):
+            adapter = int(str(adapter).lstrip('hci') or 0)
+        sim_adapter = self.adapters[adapter % len(self.adapters)]
+        self.clock.advance(self.connect_time)
+        if sim_adapter.nb_links >= sim_adapter.max_connections:
+            raise btle.BTLEException(
+                btle.BTLEException.DISCONNECTED,
+                'Adapter {} has no free link'.format(sim_adapter.index))
+        sim_adapter.nb_links += 1
+        if mac_address not in self.bulbs:
+            self.bulbs[mac_address] = SimBulb(mac_address, self.clock)
+        return SimPeripheral(self, self.bulbs[mac_address], sim_adapter)
+
+
+def _percentile(values, percent):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    rank = max(0, int(math.ceil(percent / 100.0 * len(values))) - 1)
+    return values[rank]
+
+
+def run_scenes(network, bulbs, scene_rate=10.0, duration=5.0,
+               poll_rate=0.0):
+    """
+    Change the color of all the bulbs scene_rate times per second
+
+    :param network: the :class:`SimNetwork` of the bulbs
+    :param bulbs: list of connected :class:`.MagicBlue`
+    :param scene_rate: scenes per second
+    :param duration: simulated seconds
+    :param poll_rate: device info requests per second, sent to the bulbs in
+        turn, waiting for the answer
+    :return: a :class:`SweepResult`
+    """
+    clock = network.clock
+    start = clock.now
+    nb_writes = len(network.write_latencies)
+    latencies = []
+    late_scenes = 0
+    next_poll = start
+    polled = 0
+    nb_scenes = int(duration * scene_rate)
+    for scene in range(nb_scenes):
+        due = start + scene / scene_rate
+        if clock.now > due:
+            late_scenes += 1
+        clock.advance_to(due)
+
+        color = [(scene * 37 + i * 11) % 256 for i in range(3)]
+        for bulb in bulbs:
+            bulb.set_color(color)
+        latencies.append(max(bulb._connection.last_done
+                             for bulb in bulbs) - due if bulbs else 0.0)
+
+        while poll_rate and bulbs and clock.now >= next_poll:
+            try:
+                bulbs[polled % len(bulbs)].get_device_info(timeout=1.0)
+            except TimeoutError:
+                logger.warning('Simulated poll timed out')
+            polled += 1
+            next_poll += 1.0 / poll_rate
+
+    nb_writes = len(network.write_latencies) - nb_writes
+    elapsed = max(clock.now, max((bulb._connection.last_done
+                                  for bulb in bulbs), default=0)) - start
+    return SweepResult(len(network.adapters), len(bulbs), len(bulbs),
+                       nb_scenes, late_scenes,
+                       nb_writes / elapsed if elapsed else 0.0,
+                       _percentile(latencies, 50), _percentile(latencies, 95),
+                       _percentile(latencies, 99), max(latencies or [0.0]))
+
+
+def sweep(bulb_counts, adapter_counts=(1,), scene_rate=10.0, duration=5.0,
+          poll_rate=0.0, **model):
+    """
+    Simulate every combination of number of bulbs and adapters
+
+    :param model: parameters of :class:`SimNetwork`
+    :return: list of :class:`SweepResult`
+    """
+    results = []
+    for nb_adapters in adapter_counts:
+        for nb_bulbs in bulb_counts:
+            network = SimNetwork(nb_adapters, **model)
+            bulbs = []
+            for i, mac in enumerate(network.macs(nb_bulbs)):
+                bulb = network.create_bulb(mac)
+                if bulb.connect(i % nb_adapters):
+                    bulbs.append(bulb)
+            result = run_scenes(network, bulbs, scene_rate, duration,
+                                poll_rate)
+            results.append(result._replace(nb_bulbs=nb_bulbs))
+            for bulb in bulbs:
+                bulb.disconnect()
+    return results
+
+
+def print_sweep(results, out=sys.stdout):
+    header = '{: >8} {: >6} {: >9} {: >6} {: >8} {: >8} {: >8} {: >8}'
+    row = '{: >8} {: >6} {: >9} {: >6} {: >8.0f} {: >8.1f} {: >8.1f} ' \
+          '{: >8.1f}'
+    print(header.format('adapters', 'bulbs', 'connected', 'late',
+                        'writes/s', 'p50 ms', 'p95 ms', 'p99 ms'), file=out)
+    for r in results:
+        print(row.format(r.nb_adapters, r.nb_bulbs, r.nb_connected,
+                         r.late_scenes, r.throughput, r.p50 * 1000,
+                         r.p95 * 1000, r.p99 * 1000), file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate fleets of Magic Blue bulbs changing scenes')
+    parser.add_argument('--bulbs', type=int, nargs='+', default=[5, 10, 20],
+                        help='Numbers of bulbs to simulate')
+    parser.add_argument('--adapters', type=int, nargs='+', default=[1],
+                        help='Numbers of adapters to simulate')
+    parser.add_argument('--rate', type=float, default=10.0,
+                        help='Scenes per second')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='Simulated seconds')
+    parser.add_argument('--poll-rate', type=float, default=0.0,
+                        help='Device info requests per second')
+    parser.add_argument('--max-connections', type=int, default=7,
+                        help='Links per adapter')
+    parser.add_argument('--interval', type=float, default=0.0075,
+                        help='Connection interval in seconds')
+    parser.add_argument('--write-time', type=float, default=0.0025,
+                        help='Radio time of a write in seconds')
+    params = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    print_sweep(sweep(params.bulbs, params.adapters, params.rate,
+                      params.duration, params.poll_rate,
+                      max_connections=params.max_connections,
+                      interval=params.interval,
+                      write_time=params.write_time))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
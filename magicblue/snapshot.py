@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : snapshot.py
+# description     : Save and restore the state of Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+import json
+import logging
+from collections import namedtuple
+
+try:
+    from magicblue.magicbluelib import Effect, Protocol
+    from magicblue.fleet import fan_out
+except ImportError:
+    from magicbluelib import Effect, Protocol
+    from fleet import fan_out
+
+
+__all__ = ['BulbState', 'Snapshot', 'snapshot', 'restore', 'restore_frames']
+
+
+logger = logging.getLogger(__name__)
+
+
+#: State of a bulb, as much as needed to restore it
+BulbState = namedtuple('BulbState', ['on', 'effect_no', 'effect_speed',
+                                     'r', 'g', 'b', 'brightness'])
+
+
+class Snapshot:
+    """
+    States of many bulbs, indexed by MAC address
+    """
+
+    def __init__(self, states=None):
+        """
+        :param states: dict of MAC address => :class:`BulbState`
+        """
+        self.states = dict(states or {})
+
+    @classmethod
+    def from_device_info(cls, device_infos):
+        """
+        :param device_infos: dict of MAC address => device info as returned
+            by :meth:`.Protocol.decode_device_info`
+        """
+        return cls({mac: BulbState(*(info[field]
+                                     for field in BulbState._fields))
+                    for mac, info in device_infos.items()})
+
+    def save(self, path):
+        """
+        Write the snapshot to path, as compact JSON
+        """
+        with open(path, 'w') as f:
+            json.dump({mac: [int(value) for value in state]
+                       for mac, state in self.states.items()},
+                      f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a snapshot written by :meth:`save`
+        """
+        with open(path) as f:
+            data = json.load(f)
+        return cls({mac: BulbState(bool(values[0]), *values[1:])
+                    for mac, values in data.items()})
+
+    def __getitem__(self, mac_address):
+        return self.states[mac_address]
+
+    def __contains__(self, mac_address):
+        return mac_address in self.states
+
+    def __len__(self):
+        return len(self.states)
+
+
+def snapshot(bulbs, timeout=2.0, max_parallel=None):
+    """
+    Query the state of all bulbs in parallel
+
+    :param bulbs: list of connected :class:`.MagicBlue`
+    :param timeout: how long to wait for each bulb to answer, in seconds
+    :param max_parallel: maximum number of bulbs queried at the same time
+    :return: a :class:`Snapshot`. Bulbs that didn't answer are left out
+    """
+    results = fan_out(bulbs, lambda bulb: bulb.get_device_info(timeout),
+                      max_parallel)
+    device_infos = {}
+    for result in results:
+        if result.error is not None:
+            logger.warning('Could not snapshot {}: {}'.format(result.bulb,
+                                                              result.error))
+        else:
+            device_infos[result.bulb.mac_address] = result.value
+    return Snapshot.from_device_info(device_infos)
+
+
+def restore_frames(state, current=None):
+    """
+    Messages to send to a bulb to bring it back to state. The color, warm
+    light or effect of a bulb that was off are restored too, before turning
+    it off, so it comes back as it was when turned on again
+
+    :param state: the :class:`BulbState` to restore
+    :param current: the :class:`BulbState` the bulb is in, if known. Only
+        what differs from it is sent
+    :return: list of messages
+    """
+    frames = []
+    if state.on and (current is None or not current.on):
+        frames.append(Protocol.encode_turn_on())
+
+    if _is_effect(state.effect_no):
+        if current is None or (current.effect_no, current.effect_speed) != \
+                (state.effect_no, state.effect_speed):
+            frames.append(Protocol.encode_set_effect(state.effect_no,
+                                                     state.effect_speed))
+    else:
+        if current is not None and _is_effect(current.effect_no):
+            current = current._replace(r=None, brightness=None)
+        if (state.r, state.g, state.b) == (0, 0, 0) and state.brightness:
+            if current is None or current.brightness != state.brightness:
+                frames.append(Protocol.encode_set_brightness(
+                    state.brightness))
+        elif current is None or (current.r, current.g, current.b) != \
+                (state.r, state.g, state.b):
+            frames.append(Protocol.encode_set_rgb(state.r, state.g, state.b))
+
+    # Changing the light of a bulb can turn it on, so turn it off last
+    if not state.on and (frames or current is None or current.on):
+        frames.append(Protocol.encode_turn_off())
+    return frames
+
+
+def _is_effect(effect_no):
+    try:
+        Effect(effect_no)
+    except ValueError:
+        return False
+    return True
+
+
+def restore(snapshot, bulbs, current=None, max_parallel=None):
+    """
+    Bring bulbs back to the state saved in snapshot, concurrently
+
+    :param snapshot: the :class:`Snapshot` to restore
+    :param bulbs: list of connected :class:`.MagicBlue`
+    :param current: a :class:`Snapshot` of the current state of the bulbs,
+        to send only what changed. Everything is sent if not given
+    :param max_parallel: maximum number of bulbs restored at the same time
+    :return: list of :class:`.BulbResult` with the number of messages sent
+    """
+    def restore_bulb(bulb):
+        mac = bulb.mac_address
+        known = current[mac] if current is not None and mac in current \
+            else None
+        frames = restore_frames(snapshot[mac], known)
+        bulb.send_frames(frames)
+        return len(frames)
+
+    bulbs = [bulb for bulb in bulbs if bulb.mac_address in snapshot]
+    return fan_out(bulbs, restore_bulb, max_parallel)
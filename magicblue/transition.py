@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : transition.py
+# description     : Client-side color transitions for Magic Blue bulbs
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# python_version  : 3.4
+# =============================================================================
+import logging
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from magicblue.colors import parse_color
+except ImportError:
+    from colors import parse_color
+
+
+__all__ = ['Transition', 'PacedSender', 'compute_frames', 'changed_mask',
+           'EASINGS', 'INTERPOLATIONS']
+
+
+logger = logging.getLogger(__name__)
+
+
+def _ease_in_out(t):
+    return t * t * (3 - 2 * t)
+
+
+#: Easing curves, mapping linear progress in [0, 1] to eased progress
+EASINGS = {
+    'linear': lambda t: t,
+    'ease_in': lambda t: t * t,
+    'ease_out': lambda t: 1 - (1 - t) * (1 - t),
+    'ease_in_out': _ease_in_out,
+}
+
+#: Supported interpolation spaces
+INTERPOLATIONS = ('linear', 'hsv', 'gamma')
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('numpy is required for transitions, '
+                          'install it with "pip install numpy"')
+
+
+def compute_frames(start, end, steps, interpolation='linear',
+                   easing='linear', gamma=2.2):
+    """
+    Compute the interpolated colors of many bulbs at once
+
+    :param start: array-like of shape (nb_bulbs, 3), colors at the start
+    :param end: array-like of shape (nb_bulbs, 3), colors at the end
+    :param steps: number of frames to compute after the start frame
+    :param interpolation: one of :data:`INTERPOLATIONS`
+    :param easing: one of the keys of :data:`EASINGS`
+    :param gamma: gamma used by the 'gamma' interpolation
+    :return: uint8 array of shape (steps + 1, nb_bulbs, 3), frame 0 being
+        the start colors
+    """
+    _require_numpy()
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError('Unknown interpolation: {}'.format(interpolation))
+    if easing not in EASINGS:
+        raise ValueError('Unknown easing: {}'.format(easing))
+
+    start = np.asarray(start, dtype=np.float64).reshape(-1, 3)
+    end = np.asarray(end, dtype=np.float64).reshape(-1, 3)
+    progress = EASINGS[easing](np.linspace(0.0, 1.0, steps + 1))
+    progress = progress[:, np.newaxis, np.newaxis]
+
+    if interpolation == 'linear':
+        frames = start + (end - start) * progress
+    elif interpolation == 'gamma':
+        start_lin = (start / 255) ** gamma
+        end_lin = (end / 255) ** gamma
+        frames = (start_lin + (end_lin - start_lin) * progress) ** \
+            (1 / gamma) * 255
+    else:
+        start_hsv = _rgb_to_hsv(start / 255)
+        end_hsv = _rgb_to_hsv(end / 255)
+        # Grays have no hue, keep the hue of the other end
+        start_hsv[:, 0] = np.where(start_hsv[:, 1] == 0, end_hsv[:, 0],
+                                   start_hsv[:, 0])
+        end_hsv[:, 0] = np.where(end_hsv[:, 1] == 0, start_hsv[:, 0],
+                                 end_hsv[:, 0])
+        delta = end_hsv - start_hsv
+        # Go around the hue circle by the shortest way
+        delta[:, 0] = (delta[:, 0] + 0.5) % 1.0 - 0.5
+        hsv = start_hsv + delta * progress
+        hsv[..., 0] %= 1.0
+        frames = _hsv_to_rgb(hsv) * 255
+
+    return np.clip(np.rint(frames), 0, 255).astype(np.uint8)
+
+
+def changed_mask(frames):
+    """
+    Tell which frames actually change the color of a bulb
+
+    :param frames: array of shape (nb_frames, nb_bulbs, 3)
+    :return: bool array of shape (nb_frames, nb_bulbs). Frame 0 is the
+        current state and never needs to be sent.
+    """
+    _require_numpy()
+    mask = np.zeros(frames.shape[:2], dtype=bool)
+    mask[1:] = np.any(frames[1:] != frames[:-1], axis=2)
+    return mask
+
+
+def _rgb_to_hsv(rgb):
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    delta = maxc - minc
+    safe_delta = np.where(delta == 0, 1, delta)
+    s = np.where(maxc == 0, 0, delta / np.where(maxc == 0, 1, maxc))
+    h = np.select([maxc == r, maxc == g],
+                  [(g - b) / safe_delta, 2.0 + (b - r) / safe_delta],
+                  4.0 + (r - g) / safe_delta)
+    h = np.where(delta == 0, 0, (h / 6.0) % 1.0)
+    return np.stack([h, s, maxc], axis=-1)
+
+
+def _hsv_to_rgb(hsv):
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    i = np.floor(h * 6.0)
+    f = h * 6.0 - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i.astype(int) % 6
+    conditions = [i == k for k in range(6)]
+    r = np.select(conditions, [v, q, p, p, t, v])
+    g = np.select(conditions, [t, v, v, q, p, p])
+    b = np.select(conditions, [p, p, t, v, v, q])
+    return np.stack([r, g, b], axis=-1)
+
+
+def _current_color(bulb):
+    info = bulb.device_info
+    return [0, 0, 0] if info is None else [info.r, info.g, info.b]
+
+
+class PacedSender:
+    """
+    Send timed color writes, following the schedule with a monotonic clock.
+    When writes fall behind, the late frames of a bulb are coalesced so only
+    its most recent color is sent.
+    """
+
+    def __init__(self, write=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        :param write: function(bulb, rgb) doing the actual write. Defaults to
+            bulb.set_color
+        :param clock: monotonic clock returning seconds
+        :param sleep: function used to wait until the next frame
+        """
+        self._write = write or (lambda bulb, rgb: bulb.set_color(rgb))
+        self._clock = clock
+        self._sleep = sleep
+        self.nb_sent = 0
+        self.nb_coalesced = 0
+
+    def send(self, slots):
+        """
+        Send writes, slot by slot
+
+        :param slots: list of (offset, [(bulb, rgb), ...]) with offset in
+            seconds from now, in increasing order
+        """
+        start = self._clock()
+        pending = {}
+        for i, (offset, writes) in enumerate(slots):
+            for bulb, rgb in writes:
+                if bulb in pending:
+                    self.nb_coalesced += 1
+                pending[bulb] = rgb
+
+            delay = start + offset - self._clock()
+            if delay > 0:
+                self._sleep(delay)
+
+            is_last = i == len(slots) - 1
+            if not is_last and self._clock() >= start + slots[i + 1][0]:
+                continue  # Late: merge with next slot
+
+            for bulb, rgb in pending.items():
+                self._write(bulb, rgb)
+                self.nb_sent += 1
+            pending.clear()
+
+        if self.nb_coalesced:
+            logger.debug('Coalesced {} late writes'.format(self.nb_coalesced))
+
+
+class Transition:
+    """
+    Smooth color transition of one or many bulbs, computed client-side
+    """
+
+    def __init__(self, bulbs, targets, duration, fps=20, start=None,
+                 interpolation='linear', easing='linear'):
+        """
+        :param bulbs: list of :class:`.MagicBlue`
+        :param targets: a color or a palette (list of colors) assigned to
+            bulbs in turn. Colors are anything :func:`.parse_color` accepts
+        :param duration: duration of the transition in seconds
+        :param fps: frames computed per second
+        :param start: colors to start from, one per bulb. Defaults to the
+            last color reported by each bulb
+        :param interpolation: one of :data:`INTERPOLATIONS`
+        :param easing: one of the keys of :data:`EASINGS`
+        """
+        _require_numpy()
+        self.bulbs = list(bulbs)
+        if isinstance(targets, str) or (
+                len(targets) == 3 and all(isinstance(c, int)
+                                          for c in targets)):
+            targets = [targets]
+        palette = [parse_color(color) for color in targets]
+        self.end = np.array([palette[i % len(palette)]
+                             for i in range(len(self.bulbs))])
+        if start is None:
+            start = [_current_color(bulb) for bulb in self.bulbs]
+        self.start = np.array([parse_color(color) for color in start])
+        self.duration = duration
+        self.fps = fps
+        self.interpolation = interpolation
+        self.easing = easing
+        self._frames = None
+
+    @property
+    def frames(self):
+        """uint8 array of shape (nb_frames, nb_bulbs, 3)"""
+        if self._frames is None:
+            steps = max(1, int(round(self.duration * self.fps)))
+            self._frames = compute_frames(self.start, self.end, steps,
+                                          self.interpolation, self.easing)
+        return self._frames
+
+    def slots(self):
+        """
+        Writes to perform, without the frames that don't change anything
+
+        :return: list of (offset, [(bulb, (r, g, b)), ...])
+        """
+        frames = self.frames
+        mask = changed_mask(frames)
+        interval = self.duration / (len(frames) - 1)
+        slots = []
+        for i in np.flatnonzero(mask.any(axis=1)):
+            writes = [(self.bulbs[j], tuple(int(c) for c in frames[i, j]))
+                      for j in np.flatnonzero(mask[i])]
+            slots.append((i * interval, writes))
+        return slots
+
+    def run(self, sender=None):
+        """
+        Play the transition, blocking until it's done
+
+        :param sender: a :class:`PacedSender`, a default one writing with
+            set_color is used if not given
+        :return: the sender used
+        """
+        sender = sender or PacedSender()
+        sender.send(self.slots())
+        return sender
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# =============================================================================
+# title           : protocol_harness.py
+# description     : Round-trip/fuzz checks and decode throughput of Protocol
+# author          : Benjamin Piouffle
+# date            : 19/10/2026
+# usage           : python scripts/protocol_harness.py [-n EXAMPLES]
+# python_version  : 3.4
+# =============================================================================
+"""
+Property-based checks of every Protocol encoder/decoder pair, fuzzing of
+the notification handler and decode throughput, strict and lenient.
+Requires hypothesis (pip install hypothesis).
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, time
+
+from hypothesis import given, settings, strategies as st
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from magicblue.magicbluelib import (  # noqa: E402
+    DeviceInfo, Effect, MagicBlue, Protocol, ProtocolError, Schedule,
+    Weekday)
+
+
+byte = st.integers(0, 255)
+datetimes = st.datetimes(min_value=datetime(2000, 1, 1),
+                         max_value=datetime(2099, 12, 31)).map(
+    lambda dt: dt.replace(microsecond=0))
+times = st.times().map(lambda t: t.replace(microsecond=0))
+weekdays = st.sets(st.sampled_from(list(Weekday)))
+effects = st.sampled_from(list(Effect))
+
+
+@st.composite
+def timer_items(draw):
+    if not draw(st.booleans()):
+        return {'used': False}
+    item = {'used': True, 'turn': draw(st.sampled_from(['on', 'off']))}
+    if draw(st.booleans()):
+        item['date_time'] = draw(datetimes)
+    else:
+        item['time'] = draw(times)
+        item['repeat'] = draw(weekdays)
+    if item['turn'] == 'off':
+        return item
+    if draw(st.booleans()):
+        item['effect'] = draw(effects)
+        item['effect_speed'] = draw(st.integers(1, 20))
+    item['r'], item['g'], item['b'] = draw(byte), draw(byte), draw(byte)
+    return item
+
+
+def expected_timer_item(item):
+    """What decoding gives back for an encoded timer item"""
+    if not item['used']:
+        return item
+    expected = {'used': True, 'turn': item['turn']}
+    if 'date_time' in item:
+        expected['date_time'] = item['date_time']
+    else:
+        expected['time'] = item['time']
+        expected['repeat'] = item['repeat']
+    if 'effect' in item:
+        expected['effect'] = item['effect']
+        expected['effect_speed'] = item['effect_speed']
+    else:
+        expected['r'] = item.get('r', 0)
+        expected['g'] = item.get('g', 0)
+        expected['b'] = item.get('b', 0)
+    return expected
+
+
+@given(datetimes)
+def check_date_time(dt):
+    msg = Protocol.encode_set_date_time(dt)
+    # Bulb answers with its own header and footer around the same layout
+    reply = bytearray([0x13]) + msg[1:10] + bytearray([0x31])
+    assert Protocol.decode_date_time(reply) == dt
+    assert Protocol.decode_date_time(reply, strict=True) == dt
+
+
+@given(st.lists(timer_items(), max_size=6))
+def check_time_schedule(items):
+    msg = Protocol.encode_set_time_schedule(items)
+    assert len(msg) == 87
+    decoded = Protocol.decode_time_schedule(msg, strict=True)
+    expected = [expected_timer_item(i) for i in items]
+    expected += [{'used': False}] * (6 - len(items))
+    assert decoded == expected, (decoded, expected)
+
+
+@given(st.lists(timer_items(), min_size=6, max_size=6), st.integers(0, 5),
+       timer_items())
+def check_slot_update(items, index, item):
+    schedule = Schedule.from_buffer(Protocol.encode_set_time_schedule(items))
+    updated = schedule.replace(index, item)
+    expected = [expected_timer_item(i) for i in items]
+    expected[index] = expected_timer_item(item)
+    assert Protocol.decode_time_schedule(updated.encode(),
+                                         strict=True) == expected
+
+
+@given(st.tuples(*[byte] * 12))
+def check_device_info(values):
+    buffer = bytearray(values)
+    buffer[0], buffer[11] = 0x66, 0x99
+    info = Protocol.decode_device_info(buffer, strict=True)
+    assert info == DeviceInfo.from_buffer(buffer).as_dict()
+    assert (info['r'], info['g'], info['b']) == tuple(buffer[6:9])
+    assert info['on'] == (buffer[2] == 0x23)
+
+
+@given(byte, byte, byte, byte, st.integers(1, 20), effects)
+def check_simple_encoders(r, g, b, brightness, speed, effect):
+    assert Protocol.encode_set_rgb(r, g, b) == \
+        bytearray([0x56, r, g, b, 0x00, 0xF0, 0xAA])
+    assert Protocol.encode_set_brightness(brightness)[4] == brightness
+    assert Protocol.encode_set_effect(effect.value, speed) == \
+        bytearray([0xBB, effect.value, speed, 0x44])
+
+
+@given(st.binary(max_size=100))
+def check_strict_decoders(data):
+    for decode in (Protocol.decode_device_info, Protocol.decode_date_time,
+                   Protocol.decode_time_schedule):
+        try:
+            decode(data, strict=True)
+        except ProtocolError:
+            pass
+
+
+@given(st.lists(st.binary(max_size=30), max_size=8))
+def check_notifications(frames):
+    bulb = MagicBlue('00:00:00:00:00:00')
+    for frame in frames:
+        bulb.handleNotification(0x0E, frame)
+    # Whatever got stored must be usable
+    if bulb.device_info is not None:
+        bulb.device_info.as_dict()
+    if bulb.time_schedule is not None:
+        bulb.time_schedule.as_list()
+
+
+def run_checks(examples):
+    for check in (check_date_time, check_time_schedule, check_slot_update,
+                  check_device_info, check_simple_encoders,
+                  check_strict_decoders, check_notifications):
+        settings(max_examples=examples, deadline=None)(check)()
+        print('{: <24} ok'.format(check.__name__))
+
+
+def run_throughput(number):
+    frames = {
+        'device_info': bytes([0x66, 0x04, 0x23, 0x41, 0x20, 0x01, 0xFF,
+                              0x00, 0x00, 0x00, 0x06, 0x99]),
+        'date_time': bytes([0x13, 0x14, 0x1A, 0x0A, 0x13, 0x0C, 0x1E, 0x00,
+                            0x01, 0x00, 0x31]),
+        'time_schedule': bytes(Protocol.encode_set_time_schedule(
+            [{'used': True, 'turn': 'on', 'time': time(7, 30),
+              'repeat': set(Weekday), 'r': 255, 'g': 128, 'b': 0}] * 6)),
+    }
+    print('{: <16} {: >14} {: >14}'.format('decoder', 'lenient/s', 'strict/s'))
+    for name, frame in frames.items():
+        decode = getattr(Protocol, 'decode_' + name)
+        rates = [number / timeit.timeit(lambda: decode(frame, strict=strict),
+                                        number=number)
+                 for strict in (False, True)]
+        print('{: <16} {: >14,.0f} {: >14,.0f}'.format(name, *rates))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--examples', type=int, default=500,
+                        help='Examples per property')
+    parser.add_argument('-t', '--throughput', type=int, default=20000,
+                        help='Decodes per throughput measurement')
+    params = parser.parse_args()
+    run_checks(params.examples)
+    run_throughput(params.throughput)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
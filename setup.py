@@ -19,13 +19,17 @@ setuptools.setup(
     license='MIT',
     packages=['magicblue'],
     install_requires=[
-        'bluepy==1.1.4',
-        'webcolors'
+        'bluepy==1.1.4'
     ],
+    extras_require={
+        'transitions': ['numpy'],
+        'bridge': ['numpy'],
+    },
     include_package_data=True,
     entry_points={
         'console_scripts': [
             'magicblueshell = magicblue.magicblueshell:main',
+            'magicbluebridge = magicblue.bridge:main',
         ],
     },
     classifiers=[